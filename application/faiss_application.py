@@ -1,36 +1,129 @@
 import sys
 import os
+import time
+import asyncio
 
-from typing import Annotated, List
-from fastapi import FastAPI, Form, HTTPException
+from typing import Annotated, List, Optional
+from fastapi import FastAPI, Form, Depends, HTTPException
 
 sys.path.append(os.getcwd() + '/../')
 sys.path.append(os.getcwd() + '/../')
 
-from model.columns_finder import ColumnsFinder
+from model.columns_finder import ColumnsFinder, SentenceTransformerEmbeddings
+from model.dispatcher import create_dispatcher
+from model.index_registry import IndexRegistry
+from model.metrics import metrics_response, trace_middleware
 from configs.configs import LLAVA_URLS
 
 app = FastAPI()
-cf = ColumnsFinder(LLAVA_URLS)
+app.middleware("http")(trace_middleware)
+embeddings = SentenceTransformerEmbeddings()
+dispatcher = create_dispatcher(LLAVA_URLS)
+registry = IndexRegistry(lambda: ColumnsFinder(LLAVA_URLS, embeddings=embeddings, dispatcher=dispatcher))
 
 
-@app.post("/fill_questions_db/")
+def require_ready():
+    if not embeddings.loader.ready:
+        raise HTTPException(status_code=503, detail="Embeddings are still loading.")
+
+
+@app.on_event("startup")
+async def load_embeddings():
+    embeddings.loader.start()
+
+
+@app.on_event("shutdown")
+async def close_dispatcher():
+    dispatcher.close()
+
+
+@app.post("/fill_questions_db/", dependencies=[Depends(require_ready)])
 async def fill_questions_db(
-        image_files: Annotated[str, Form()]
+        image_files: Annotated[str, Form()],
+        dataset_id: Annotated[Optional[str], Form()] = None,
+        persist: Annotated[bool, Form()] = True
+):
+    return await registry.build(dataset_id or registry.new_dataset_id(), image_files.split(' '),
+                                persist=persist and dataset_id is not None)
+
+
+@app.post("/indexes/build/", dependencies=[Depends(require_ready)])
+async def build_index(
+        image_files: Annotated[str, Form()],
+        dataset_id: Annotated[Optional[str], Form()] = None,
+        rebuild: Annotated[bool, Form()] = False
 ):
-    image_files = image_files.split(' ')
-    if cf.question_db is not None:
-        cf.clear_stash()
+    dataset_id = dataset_id or registry.new_dataset_id()
+    columns = await registry.build(dataset_id, image_files.split(' '), rebuild)
+    return {"dataset_id": dataset_id, "columns": columns}
 
-    columns = await cf.create_column_names(image_files)
-    return columns
 
+@app.post("/add_questions/", dependencies=[Depends(require_ready)])
+async def add_questions(
+        questions: Annotated[List[str], Form()],
+        dataset_id: Annotated[Optional[str], Form()] = None
+):
+    dataset_id = dataset_id or registry.latest
+    if dataset_id is None:
+        raise HTTPException(status_code=400, detail="No dataset_id given and no index was built yet.")
+
+    return {"dataset_id": dataset_id, "added": await registry.add_questions(dataset_id, questions)}
 
-@app.get("/get_nearest_question/")
+
+@app.get("/get_nearest_question/", dependencies=[Depends(require_ready)])
 async def get_nearest_question(
-        question: Annotated[str, Form()]
+        question: Annotated[str, Form()],
+        dataset_id: Annotated[Optional[str], Form()] = None
 ):
-    if cf.question_db is None:
+    dataset_id = dataset_id or registry.latest
+    nearest = await registry.nearest(dataset_id, [question]) if dataset_id is not None else None
+    if nearest is None:
         raise HTTPException(status_code=400, detail="Question database isn't full.")
 
-    return {question: cf.question_db.max_marginal_relevance_search(question)[0].page_content}
+    return {question: nearest[0]}
+
+
+@app.get("/indexes/{dataset_id}/nearest/", dependencies=[Depends(require_ready)])
+async def nearest_questions(
+        dataset_id: str,
+        questions: Annotated[List[str], Form()]
+):
+    nearest = await registry.nearest(dataset_id, questions)
+    if nearest is None:
+        raise HTTPException(status_code=404, detail=f"Index {dataset_id} doesn't exist.")
+
+    return dict(zip(questions, nearest))
+
+
+@app.delete("/indexes/{dataset_id}/")
+async def drop_index(dataset_id: str):
+    return {"dataset_id": dataset_id, "dropped": await registry.drop(dataset_id)}
+
+
+@app.get("/indexes/")
+async def indexes():
+    return registry.stats
+
+
+@app.post("/warmup", dependencies=[Depends(require_ready)])
+async def warmup():
+    start = time.perf_counter()
+    await asyncio.to_thread(embeddings.get_embeddings.embed_query, 'What is shown in the picture?')
+    return {"warmup_seconds": time.perf_counter() - start}
+
+
+@app.get("/healthz")
+async def healthz():
+    if embeddings.loader.error is not None:
+        raise HTTPException(status_code=503, detail=f"Embeddings failed to load: {embeddings.loader.error!r}")
+    return {"status": "ok"}
+
+
+@app.get("/readyz", dependencies=[Depends(require_ready)])
+async def readyz():
+    return {"status": "ready", "load_seconds": embeddings.loader.load_seconds}
+
+
+@app.get("/metrics")
+async def metrics():
+    return metrics_response()
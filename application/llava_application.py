@@ -1,8 +1,9 @@
 import os
 import sys
+import json
 
-from typing import Annotated
-from fastapi import FastAPI, Form
+from typing import Annotated, Optional
+from fastapi import FastAPI, Form, Depends, HTTPException, UploadFile
 
 sys.path.append(os.getcwd() + '/../LLaVA')
 sys.path.append(os.getcwd() + '/../LLaVA/llava')
@@ -11,38 +12,196 @@ sys.path.append(os.getcwd() + '/../configs')
 sys.path.append(os.getcwd() + '/../model')
 
 from configs.configs import MODEL_NAME
-from configs.configs_app import MODEL_LOGGING, MODEL_TEMPERATURE, MODEL_MAX_NEW_TOKENS
-from table_former import TableFormer
+from configs.configs_app import (MODEL_LOGGING, GENERATION_PROFILES, IMAGE_CACHE_MAX_BYTES,
+                                 PREFIX_CACHING, PREFIX_CACHE_MAX_BYTES, SCHEDULER_MAX_BATCH_SIZE,
+                                 SCHEDULER_MAX_WAIT_MS, WARMUP_ON_STARTUP, PREFETCH_WORKERS,
+                                 RESULT_CACHE_ON, RESULT_CACHE_PATH, RESULT_CACHE_MEMORY_ENTRIES, MODEL_DEVICE,
+                                 CPU_QUANTIZATION, CPU_INTRA_OP_THREADS, CPU_INTER_OP_THREADS, CPU_CORE_PINNING,
+                                 CPU_WORKER_INDEX)
+from model.image_cache import SharedImage
+from model.metrics import metrics_response, trace_middleware
+from model.structured_extraction import extraction_max_new_tokens, extraction_prompt, parse_extraction
+from inference_scheduler import InferenceScheduler
+from image_prefetcher import ImagePrefetcher
+from lazy_loader import LazyLoader
+from result_cache import ResultCache
 
 app = FastAPI()
-former = TableFormer(MODEL_NAME)
+app.middleware("http")(trace_middleware)
+result_cache = ResultCache(RESULT_CACHE_PATH, MODEL_NAME, RESULT_CACHE_MEMORY_ENTRIES) if RESULT_CACHE_ON else None
+scheduler = InferenceScheduler(None, max_batch_size=SCHEDULER_MAX_BATCH_SIZE, max_wait_ms=SCHEDULER_MAX_WAIT_MS,
+                               logging=MODEL_LOGGING, result_cache=result_cache)
+warmup_seconds = None
 
 
-@app.post("/create_questions/")
+def create_former():
+    from table_former import TableFormer
+
+    return TableFormer(MODEL_NAME, device=MODEL_DEVICE, image_cache_bytes=IMAGE_CACHE_MAX_BYTES,
+                       prefix_caching=PREFIX_CACHING, prefix_cache_bytes=PREFIX_CACHE_MAX_BYTES,
+                       cpu_quantization=CPU_QUANTIZATION, num_threads=CPU_INTRA_OP_THREADS,
+                       inter_op_threads=CPU_INTER_OP_THREADS, core_pinning=CPU_CORE_PINNING,
+                       worker_index=CPU_WORKER_INDEX)
+
+
+def on_former_loaded(former):
+    global warmup_seconds
+
+    scheduler.former = former
+    scheduler.prefetcher = ImagePrefetcher(former, max_workers=PREFETCH_WORKERS)
+    if WARMUP_ON_STARTUP:
+        warmup_seconds = former.warmup()
+
+
+former_loader = LazyLoader(create_former, on_load=on_former_loaded)
+
+
+def parse_answer_types(answer_types: Optional[str]):
+    return json.loads(answer_types) if answer_types else None
+
+
+def require_ready():
+    if not former_loader.ready:
+        raise HTTPException(status_code=503, detail="Model is still loading.")
+
+
+@app.on_event("startup")
+async def start_scheduler():
+    scheduler.start()
+    former_loader.start()
+
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    await scheduler.stop()
+    if result_cache is not None:
+        result_cache.close()
+
+
+@app.post("/create_questions/", dependencies=[Depends(require_ready)])
 async def create_questions(
         image_file: Annotated[str, Form()]
 ):
-    result = await former.create_questions(image_file=image_file, logging=MODEL_LOGGING,
-                                           temperature=MODEL_TEMPERATURE, max_new_tokens=MODEL_MAX_NEW_TOKENS)
+    result = await scheduler.submit(image_file=image_file, input=former_loader.value.QUESTIONS_PROMPT,
+                                    **GENERATION_PROFILES['questions'])
     return {"questions": result}
 
 
-@app.post("/create_captioning/")
+@app.post("/create_captioning/", dependencies=[Depends(require_ready)])
 async def create_caption(
         image_file: Annotated[str, Form()]
 ):
     inp = "Create a caption if this picture."
-    result = await former.predict(image_file=image_file, input=inp, logging=MODEL_LOGGING,
-                                  temperature=MODEL_TEMPERATURE, max_new_tokens=MODEL_MAX_NEW_TOKENS)
+    result = await scheduler.submit(image_file=image_file, input=inp, **GENERATION_PROFILES['caption'])
     return {"answer": result}
 
 
-@app.post("/create_vqa/")
+@app.post("/create_vqa/", dependencies=[Depends(require_ready)])
 async def create_vqa(
         image_file: Annotated[str, Form()],
-        question: Annotated[str, Form()]
-
+        question: Annotated[str, Form()],
+        refresh: Annotated[bool, Form()] = False
 ):
-    result = await former.predict(image_file=image_file, input=question, logging=MODEL_LOGGING,
-                                  temperature=MODEL_TEMPERATURE, max_new_tokens=MODEL_MAX_NEW_TOKENS)
+    result = await scheduler.submit(image_file=image_file, input=question, refresh=refresh,
+                                    **GENERATION_PROFILES['short_answer'])
     return {"question": question, "answer": result}
+
+
+@app.post("/create_vqa_batch/", dependencies=[Depends(require_ready)])
+async def create_vqa_batch(
+        image_file: Annotated[str, Form()],
+        questions: Annotated[str, Form()],
+        refresh: Annotated[bool, Form()] = False,
+        answer_types: Annotated[Optional[str], Form()] = None
+):
+    result = await scheduler.submit_many(image_file=image_file, inputs=json.loads(questions),
+                                         refresh=refresh, answer_types=parse_answer_types(answer_types),
+                                         **GENERATION_PROFILES['short_answer'])
+    return {"answers": result}
+
+
+@app.post("/create_table_row/", dependencies=[Depends(require_ready)])
+async def create_table_row(
+        image_file: Annotated[str, Form()],
+        columns: Annotated[str, Form()],
+        refresh: Annotated[bool, Form()] = False,
+        column_types: Annotated[Optional[str], Form()] = None
+):
+    columns, column_types = json.loads(columns), parse_answer_types(column_types)
+    result = await scheduler.submit(image_file=image_file, input=extraction_prompt(columns, column_types),
+                                    refresh=refresh, max_new_tokens=extraction_max_new_tokens(columns),
+                                    **GENERATION_PROFILES['table_row'])
+    return {"answer": result, "fields": parse_extraction(result['outputs'], columns, column_types)}
+
+
+@app.post("/create_vqa_bytes/", dependencies=[Depends(require_ready)])
+async def create_vqa_bytes(
+        image: UploadFile,
+        questions: Annotated[str, Form()],
+        refresh: Annotated[bool, Form()] = False,
+        answer_types: Annotated[Optional[str], Form()] = None
+):
+    result = await scheduler.submit_many(image_file=await image.read(), inputs=json.loads(questions),
+                                         refresh=refresh, answer_types=parse_answer_types(answer_types),
+                                         **GENERATION_PROFILES['short_answer'])
+    return {"answers": result}
+
+
+@app.post("/create_vqa_shm/", dependencies=[Depends(require_ready)])
+async def create_vqa_shm(
+        shm_name: Annotated[str, Form()],
+        width: Annotated[int, Form()],
+        height: Annotated[int, Form()],
+        questions: Annotated[str, Form()],
+        refresh: Annotated[bool, Form()] = False,
+        answer_types: Annotated[Optional[str], Form()] = None
+):
+    image = SharedImage(shm_name, width, height)
+    result = await scheduler.submit_many(image_file=image, inputs=json.loads(questions),
+                                         refresh=refresh, answer_types=parse_answer_types(answer_types),
+                                         **GENERATION_PROFILES['short_answer'])
+    return {"answers": result}
+
+
+@app.post("/prefetch/", dependencies=[Depends(require_ready)])
+async def prefetch(
+        image_files: Annotated[str, Form()]
+):
+    scheduler.prefetcher.prefetch(image_files.split(' '))
+    return scheduler.prefetcher.stats
+
+
+@app.get("/image_cache_stats/", dependencies=[Depends(require_ready)])
+async def image_cache_stats():
+    former = former_loader.value
+    return {"image_cache": former.image_cache.stats, "prefix_cache": former.prefix_cache.stats}
+
+
+@app.get("/scheduler_stats/")
+async def scheduler_stats():
+    return scheduler.stats
+
+
+@app.post("/warmup", dependencies=[Depends(require_ready)])
+async def warmup():
+    global warmup_seconds
+
+    warmup_seconds = await scheduler.run_exclusive(former_loader.value.warmup)
+    return {"warmup_seconds": warmup_seconds}
+
+
+@app.get("/healthz")
+async def healthz():
+    if former_loader.error is not None:
+        raise HTTPException(status_code=503, detail=f"Model failed to load: {former_loader.error!r}")
+    return {"status": "ok"}
+
+
+@app.get("/readyz", dependencies=[Depends(require_ready)])
+async def readyz():
+    return {"status": "ready", "load_seconds": former_loader.load_seconds, "warmup_seconds": warmup_seconds}
+
+
+@app.get("/metrics")
+async def metrics():
+    return metrics_response()
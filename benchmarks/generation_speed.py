@@ -0,0 +1,93 @@
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from configs.configs import MODEL_NAME
+
+QUESTIONS = ['What is shown in the picture?', 'What color is the main object?', 'How many people are there?',
+             'Where was this picture taken?', 'What time of day is it?', 'What is the weather like?',
+             'What is the person doing?', 'Is there any text in the picture?']
+
+
+def synthetic_image() -> str:
+    from PIL import Image
+
+    handle, image_file = tempfile.mkstemp(suffix='.png')
+    os.close(handle)
+    Image.effect_noise((336, 336), 64).convert('RGB').save(image_file)
+    return image_file
+
+
+def measure(former, image_file: str, batch_size: int, max_new_tokens: int, repeats: int) -> dict:
+    requests = [(image_file, QUESTIONS[i % len(QUESTIONS)]) for i in range(batch_size)]
+    output_tokens, seconds = 0, 0.0
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        results = former.generate_many(requests, temperature=0.0, max_new_tokens=max_new_tokens)
+        seconds += time.perf_counter() - start
+        output_tokens += sum(len(former.tokenizer(result['outputs'], add_special_tokens=False).input_ids)
+                             for result in results)
+
+    return {"batch_size": batch_size, "requests": batch_size * repeats, "output_tokens": output_tokens,
+            "seconds": seconds, "tokens_per_second": output_tokens / seconds,
+            "seconds_per_request": seconds / (batch_size * repeats)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure TableFormer generation tokens/sec on CPU or CUDA.')
+    parser.add_argument('--model', default=MODEL_NAME)
+    parser.add_argument('--device', default='auto', choices=['auto', 'cpu', 'cuda'])
+    parser.add_argument('--quantization', default='int8', choices=['int8', 'bf16', 'none'])
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--inter-op-threads', type=int, default=1)
+    parser.add_argument('--core-pinning', action='store_true')
+    parser.add_argument('--worker-index', type=int, default=0)
+    parser.add_argument('--image', default=None)
+    parser.add_argument('--batch-sizes', nargs='*', type=int, default=[1, 4, 8])
+    parser.add_argument('--max-new-tokens', type=int, default=32)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    sys.path.append(os.path.join(ROOT, 'LLaVA'))
+    from model.table_former import TableFormer
+
+    start = time.perf_counter()
+    former = TableFormer(args.model, device=args.device,
+                         cpu_quantization=None if args.quantization == 'none' else args.quantization,
+                         num_threads=args.threads, inter_op_threads=args.inter_op_threads,
+                         core_pinning=args.core_pinning, worker_index=args.worker_index)
+    load_seconds = time.perf_counter() - start
+    warmup_seconds = former.warmup()
+
+    image_file = args.image or synthetic_image()
+    try:
+        runs = [measure(former, image_file, batch_size, args.max_new_tokens, args.repeats)
+                for batch_size in args.batch_sizes]
+    finally:
+        if args.image is None:
+            os.remove(image_file)
+
+    import torch
+
+    results = {"config": vars(args), "device": former.device, "dtype": str(former.dtype),
+               "intra_op_threads": torch.get_num_threads(), "inter_op_threads": torch.get_num_interop_threads(),
+               "load_seconds": load_seconds, "warmup_seconds": warmup_seconds,
+               "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, "runs": runs}
+
+    print(json.dumps(results, indent=2))
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
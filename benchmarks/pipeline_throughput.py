@@ -0,0 +1,152 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import resource
+import subprocess
+import threading
+
+import numpy as np
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'evaluation'))
+
+from main_pipeline import Controller
+
+
+def open_connections() -> int:
+    count = 0
+    for fd in os.listdir('/proc/self/fd'):
+        try:
+            count += os.readlink(f'/proc/self/fd/{fd}').startswith('socket:')
+        except OSError:
+            pass
+    return count
+
+
+class ConnectionSampler:
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, open_connections())
+            self._stop.wait(self.interval)
+
+
+def start_stubs(port: int, latency_ms: float, jitter_ms: float, failure_rate: float, columns: int) -> subprocess.Popen:
+    process = subprocess.Popen([sys.executable, '-m', 'benchmarks.stub_services', '--port', str(port),
+                                '--latency-ms', str(latency_ms), '--jitter-ms', str(jitter_ms),
+                                '--failure-rate', str(failure_rate), '--columns', str(columns)], cwd=ROOT)
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f'http://127.0.0.1:{port}/healthz', timeout=1).status_code == 200:
+                return process
+        except requests.RequestException:
+            time.sleep(0.1)
+
+    process.terminate()
+    raise TimeoutError('Stub services were not ready in time')
+
+
+async def run_pipeline(controller: Controller, image_files, latencies):
+    post = controller.dispatcher.post
+
+    async def timed_post(session, endpoint, payload):
+        start = time.perf_counter()
+        try:
+            return await post(session, endpoint, payload)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    controller.dispatcher.post = timed_post
+    return await controller.main_pipeline(image_files)
+
+
+def benchmark(size: int, url: str, extraction_mode: str) -> dict:
+    requests.post(f'{url}/reset')
+    controller = Controller(llava_urls=[url], faiss_url=url, extraction_mode=extraction_mode)
+    controller.evaluation_on = False
+
+    image_files = [f'synthetic/image_{i}.jpg' for i in range(size)]
+    latencies = []
+
+    try:
+        with ConnectionSampler() as sampler:
+            start = time.perf_counter()
+            result = asyncio.run(run_pipeline(controller, image_files, latencies))
+            elapsed = time.perf_counter() - start
+    finally:
+        controller.close()
+
+    served = requests.get(f'{url}/stats').json()
+    total_requests = sum(served['requests'].values())
+    latencies = np.asarray(latencies) * 1000
+
+    return {
+        "images": size,
+        "seconds": elapsed,
+        "images_per_second": size / elapsed,
+        "requests": total_requests,
+        "requests_per_second": total_requests / elapsed,
+        "latency_ms": {f"p{q}": float(np.percentile(latencies, q)) if len(latencies) else None for q in (50, 95, 99)},
+        "failed_rows": len(controller.dispatcher.failures),
+        "rows": len(result["dataframe"]),
+        "fallback_cells": controller.fallback_cells,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_open_connections": sampler.peak,
+        "server": served
+    }
+
+
+def git_revision() -> str:
+    output = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True)
+    return output.stdout.strip() or None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure Controller throughput against stub services.')
+    parser.add_argument('--sizes', nargs='*', type=int, default=[100, 1000, 10000, 100000])
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--jitter-ms', type=float, default=10)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--columns', type=int, default=5)
+    parser.add_argument('--extraction-mode', default='per_question', choices=['per_question', 'single_pass'])
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    process = start_stubs(args.port, args.latency_ms, args.jitter_ms, args.failure_rate, args.columns)
+    try:
+        runs = [benchmark(size, f'http://127.0.0.1:{args.port}', args.extraction_mode) for size in args.sizes]
+    finally:
+        process.terminate()
+        process.wait()
+
+    results = {"revision": git_revision(), "config": vars(args), "runs": runs}
+
+    print(json.dumps(results, indent=2))
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
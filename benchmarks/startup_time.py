@@ -0,0 +1,70 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_seconds(module: str) -> float:
+    code = f'import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)'
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def wait_for(url: str, deadline: float, process: subprocess.Popen) -> float:
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Server exited with code {process.returncode}')
+
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return time.monotonic()
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+
+    raise TimeoutError(f'{url} was not ready in time')
+
+
+def server_startup(app: str, port: int, timeout: float) -> dict:
+    start = time.monotonic()
+    process = subprocess.Popen([sys.executable, '-m', 'uvicorn', app, '--port', str(port)],
+                               cwd=os.path.join(ROOT, 'application'))
+
+    try:
+        deadline = start + timeout
+        healthy = wait_for(f'http://localhost:{port}/healthz', deadline, process)
+        ready = wait_for(f'http://localhost:{port}/readyz', deadline, process)
+    finally:
+        process.terminate()
+        process.wait()
+
+    return {"app": app, "healthz_seconds": healthy - start, "readyz_seconds": ready - start}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure import and time-to-ready of the services.')
+    parser.add_argument('--modules', nargs='*', default=['model.columns_finder', 'main_pipeline'])
+    parser.add_argument('--apps', nargs='*', default=['faiss_application:app=8010', 'llava_application:app=8000'])
+    parser.add_argument('--timeout', type=float, default=1800)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    results = {"imports": {module: import_seconds(module) for module in args.modules}, "servers": []}
+    for spec in args.apps:
+        app, port = spec.split('=')
+        results["servers"].append(server_startup(app, int(port), args.timeout))
+
+    print(json.dumps(results, indent=2))
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
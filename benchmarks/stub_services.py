@@ -0,0 +1,112 @@
+import re
+import json
+import random
+import asyncio
+import argparse
+
+from collections import Counter
+
+from aiohttp import web
+
+
+class StubServices:
+    def __init__(self, latency_ms: float = 50, jitter_ms: float = 10, failure_rate: float = 0.0,
+                 columns: int = 5, answer: str = '42', score: float = 7, rate_limited: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.columns = [f'column_{i}' for i in range(columns)]
+        self.answer = answer
+        self.score = score
+        self.rate_limited = rate_limited
+
+        self.requests = Counter()
+        self.failures = Counter()
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/create_questions/', self._handler('create_questions', self._create_questions))
+        app.router.add_post('/create_vqa/', self._handler('create_vqa', self._create_vqa))
+        app.router.add_post('/create_vqa_batch/', self._handler('create_vqa_batch', self._create_vqa_batch))
+        app.router.add_post('/create_table_row/', self._handler('create_table_row', self._create_table_row))
+        app.router.add_post('/fill_questions_db/', self._handler('fill_questions_db', self._fill_questions_db))
+        app.router.add_post('/chat/completions', self._chat_completions)
+        app.router.add_get('/healthz', self._ok)
+        app.router.add_get('/readyz', self._ok)
+        app.router.add_get('/stats', self._stats)
+        app.router.add_post('/reset', self._reset)
+        return app
+
+    def _handler(self, name: str, respond):
+        async def handler(request: web.Request) -> web.Response:
+            self.requests[name] += 1
+            await asyncio.sleep(max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000)
+
+            if random.random() < self.failure_rate:
+                self.failures[name] += 1
+                return web.Response(status=503)
+
+            return web.json_response(respond(await request.post()))
+
+        return handler
+
+    def _create_questions(self, form) -> dict:
+        outputs = '\n'.join(f'{i + 1}. What is the {column}?' for i, column in enumerate(self.columns))
+        return {"questions": {"prompt": form['image_file'], "outputs": outputs}}
+
+    def _create_vqa(self, form) -> dict:
+        return {"question": form['question'], "answer": {"prompt": form['question'], "outputs": self.answer}}
+
+    def _create_vqa_batch(self, form) -> dict:
+        return {"answers": {question: {"prompt": question, "outputs": self.answer}
+                            for question in json.loads(form['questions'])}}
+
+    def _create_table_row(self, form) -> dict:
+        fields = {column: self.answer for column in json.loads(form['columns'])}
+        return {"answer": {"prompt": form['columns'], "outputs": json.dumps(fields)}, "fields": fields}
+
+    def _fill_questions_db(self, form) -> list:
+        return self.columns
+
+    async def _chat_completions(self, request: web.Request) -> web.Response:
+        self.requests['chat_completions'] += 1
+        if self.requests['chat_completions'] <= self.rate_limited:
+            self.failures['chat_completions'] += 1
+            return web.json_response({"error": {"message": "Rate limit reached"}}, status=429)
+
+        content = (await request.json())['messages'][-1]['content']
+        pairs = len(re.findall(r'^\[Pair \d+\]$', content, re.MULTILINE))
+        answer = '\n'.join(f'{i}: {self.score}' for i in range(1, pairs + 1)) if pairs else str(self.score)
+        return web.json_response({"choices": [{"message": {"role": "assistant", "content": answer}}]})
+
+    async def _ok(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok"})
+
+    async def _stats(self, request: web.Request) -> web.Response:
+        return web.json_response({"requests": dict(self.requests), "failures": dict(self.failures)})
+
+    async def _reset(self, request: web.Request) -> web.Response:
+        self.requests.clear()
+        self.failures.clear()
+        return web.json_response({"status": "ok"})
+
+
+def serve(port: int, latency_ms: float, jitter_ms: float, failure_rate: float, columns: int):
+    services = StubServices(latency_ms, jitter_ms, failure_rate, columns)
+    web.run_app(services.create_app(), host='127.0.0.1', port=port, print=None, access_log=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve stub LLaVA and FAISS endpoints.')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--jitter-ms', type=float, default=10)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--columns', type=int, default=5)
+    args = parser.parse_args()
+
+    serve(args.port, args.latency_ms, args.jitter_ms, args.failure_rate, args.columns)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,78 @@
+import os
+
 MODEL_NAME = '4bit/llava-v1.5-7b-5GB'
 
 DEFAULT_COLUMNS_QUANTITY = 5
 DEFAULT_IMAGE_QUANTITY_DELIMETER = 5
 DEFAULT_IMAGE_VALIDATION = DEFAULT_IMAGE_QUANTITY_DELIMETER * 2
 
+COLUMN_DISCOVERY_MODE = 'fixed'
+ADAPTIVE_SEED_IMAGES = 64
+ADAPTIVE_ROUND_SIZE = 32
+ADAPTIVE_STABLE_ROUNDS = 3
+ADAPTIVE_CONFIDENCE_Z = 1.96
+ADAPTIVE_MAX_CALLS = 2000
+ADAPTIVE_TIME_BUDGET_SECONDS = 900
+
+EMBEDDINGS_MODEL_NAME = 'sentence-transformers/all-mpnet-base-v2'
+EMBEDDINGS_DEVICE = 'cuda'
+EMBEDDINGS_BATCH_SIZE = 256
+EMBEDDINGS_CACHE_DIR = 'embeddings_cache'
+
+QUESTION_INDEX_DIR = 'question_indexes'
+QUESTION_INDEX_TYPE = 'flat'
+QUESTION_INDEX_NLIST = 100
+QUESTION_INDEX_HNSW_M = 32
+QUESTION_CLUSTER_THRESHOLD = None
+QUESTION_INDEX_MEMORY_BUDGET = 4 * 1024 ** 3
+
 NUM_SECONDS_TO_SLEEP = 3
 
 LLAVA_URLS = ['http://localhost:8000']
 FAISS_APPLICATION_URL = ['http://localhost:8010']
 
+DISPATCHER_MAX_PER_ENDPOINT = 8
+DISPATCHER_MAX_IN_FLIGHT = 64
+DISPATCHER_MAX_RETRIES = 3
+DISPATCHER_BACKOFF_SECONDS = 0.5
+DISPATCHER_FAILURE_THRESHOLD = 3
+DISPATCHER_EJECTION_SECONDS = 30
+DISPATCHER_HEALTH_PATH = '/readyz'
+
+INFERENCE_TRANSPORT = 'http'
+RAY_ADDRESS = None
+RAY_NAMESPACE = 'sberai'
+RAY_RUNTIME_ENV = None
+RAY_POOL_NAME = 'table_former'
+RAY_MIN_REPLICAS = 1
+RAY_MAX_REPLICAS = 4
+RAY_TARGET_ONGOING_REQUESTS = 16
+RAY_DOWNSCALE_SECONDS = 300
+RAY_ACTOR_OPTIONS = {'num_gpus': 1}
+RAY_MAX_RESTARTS = 3
+RAY_MAX_TASK_RETRIES = 1
+RAY_MAX_RETRIES = 2
+RAY_SHIP_IMAGE_BYTES = True
+
+TRACE_HEADER = 'X-Trace-Id'
+TRACE_LOGGING = False
+
 EVALUATION_ON = True
+GPT_EVALUATION_ASYNC = True
+GPT_OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY', '')
+GPT_API_BASE_URL = os.environ.get('OPENAI_API_BASE', 'https://api.openai.com/v1')
+GPT_MODEL = 'gpt-3.5-turbo'
+GPT_REQUESTS_PER_MINUTE = 3500
+GPT_TOKENS_PER_MINUTE = 90000
+GPT_MAX_RETRIES = 6
+GPT_BACKOFF_SECONDS = 1.0
+GPT_PAIRS_PER_PROMPT = 8
+GPT_EVALUATION_CACHE_PATH = 'gpt_evaluation_cache.sqlite'
 GPT_EVALUATION_QUESTIONS_PROMPT = 'We would like to request your feedback on the perfomance of our AI assistant in responce of simmilarity in meaning of common theme of these questions.\n Please rate simmilarity with an overall score on a scale of 1 to 10, where higher score indicates better overall relevance.\n Please output a single line containing only one value indicating a score.'
 GPT_EVALUATION_QUESTIONS_RELEVANCE_PROMPT = 'We would like to request your feedback on the perfomance of our AI assistant in responce of relevance of generated question to picture description.\n Please rate relevance with an overall score on a scale of 1 to 10, where higher score indicates better overall relevance.\n Please output a single line containing only one value indicating a score.'
 GPT_EVALUATION_VQA_PROMPT = 'We would like to request your feedback on the perfomance of our AI assistant in responce of relevance answer to the given question.\n Please rate relevance with an overall score on a scale of 1 to 10, where higher score indicates better overall relevance.\n Please output a single line containing only one value indicating a score.'
 
 MAIN_PIPELINE_TIMEOUT = 7200
+JOB_JOURNAL_DIR = 'jobs'
+VQA_QUESTION_SUFFIX = ' Please answer one number, word or phrase.'
+EXTRACTION_MODE = 'per_question'
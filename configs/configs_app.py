@@ -1,3 +1,28 @@
+import os
+
 MODEL_LOGGING = False
+MODEL_DEVICE = os.environ.get('TABLE_FORMER_DEVICE', 'auto')
+CPU_QUANTIZATION = 'int8'
+CPU_INTRA_OP_THREADS = None
+CPU_INTER_OP_THREADS = 1
+CPU_CORE_PINNING = 'TABLE_FORMER_WORKER_INDEX' in os.environ
+CPU_WORKER_INDEX = int(os.environ.get('TABLE_FORMER_WORKER_INDEX', 0))
 MODEL_TEMPERATURE = 0.2
 MODEL_MAX_NEW_TOKENS = 512
+GENERATION_PROFILES = {
+    'short_answer': {'temperature': 0.0, 'max_new_tokens': 16, 'stop': ('\n',)},
+    'questions': {'temperature': MODEL_TEMPERATURE, 'max_new_tokens': MODEL_MAX_NEW_TOKENS, 'stop': ()},
+    'caption': {'temperature': MODEL_TEMPERATURE, 'max_new_tokens': MODEL_MAX_NEW_TOKENS, 'stop': ()},
+    'table_row': {'temperature': 0.0, 'stop': ()},
+}
+TABLE_ROW_VALUE_TOKENS = 16
+IMAGE_CACHE_MAX_BYTES = 2 * 1024 ** 3
+PREFIX_CACHING = True
+PREFIX_CACHE_MAX_BYTES = 2 * 1024 ** 3
+SCHEDULER_MAX_BATCH_SIZE = 16
+SCHEDULER_MAX_WAIT_MS = 10
+WARMUP_ON_STARTUP = True
+PREFETCH_WORKERS = 4
+RESULT_CACHE_ON = True
+RESULT_CACHE_PATH = 'vqa_results.sqlite'
+RESULT_CACHE_MEMORY_ENTRIES = 10000
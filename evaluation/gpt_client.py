@@ -0,0 +1,196 @@
+import re
+import json
+import time
+import random
+import sqlite3
+import asyncio
+import hashlib
+import threading
+
+import aiohttp
+
+from typing import List, Optional, Tuple
+
+from configs.configs import (
+    GPT_OPENAI_API_KEY,
+    GPT_API_BASE_URL,
+    GPT_MODEL,
+    GPT_REQUESTS_PER_MINUTE,
+    GPT_TOKENS_PER_MINUTE,
+    GPT_MAX_RETRIES,
+    GPT_BACKOFF_SECONDS,
+    GPT_PAIRS_PER_PROMPT,
+    GPT_EVALUATION_CACHE_PATH
+)
+
+SYSTEM_PROMPT = 'You are a helpful and precise assistant for checking relevance of the question to the given sentence.'
+SCORE_PATTERN = re.compile(r'^\s*\[?(?:Pair\s*)?(\d+)\]?\s*[:.)\-]\s*(\d+(?:\.\d+)?)', re.IGNORECASE)
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute: float):
+        self.rate = rate_per_minute / 60
+        self.capacity = rate_per_minute
+        self.tokens = rate_per_minute
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: float = 1):
+        amount = min(amount, self.capacity)
+
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+class ScoreCache:
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS scores (key TEXT PRIMARY KEY, score REAL NOT NULL)')
+        self._connection.commit()
+
+    def get(self, key: str) -> Optional[float]:
+        with self._lock:
+            row = self._connection.execute('SELECT score FROM scores WHERE key = ?', (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def put(self, key: str, score: float):
+        with self._lock:
+            self._connection.execute('INSERT OR REPLACE INTO scores (key, score) VALUES (?, ?)', (key, score))
+            self._connection.commit()
+
+    def get_many(self, keys: List[str]) -> List[Optional[float]]:
+        return [self.get(key) for key in keys]
+
+    def put_many(self, scores: List[Tuple[str, float]]):
+        with self._lock:
+            self._connection.executemany('INSERT OR REPLACE INTO scores (key, score) VALUES (?, ?)', scores)
+            self._connection.commit()
+
+
+class GPTEvaluationClient:
+    def __init__(
+            self,
+            api_key: str = GPT_OPENAI_API_KEY,
+            base_url: str = GPT_API_BASE_URL,
+            model: str = GPT_MODEL,
+            requests_per_minute: float = GPT_REQUESTS_PER_MINUTE,
+            tokens_per_minute: float = GPT_TOKENS_PER_MINUTE,
+            max_retries: int = GPT_MAX_RETRIES,
+            backoff_seconds: float = GPT_BACKOFF_SECONDS,
+            pairs_per_prompt: int = GPT_PAIRS_PER_PROMPT,
+            cache_path: Optional[str] = GPT_EVALUATION_CACHE_PATH
+    ):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.model = model
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.pairs_per_prompt = pairs_per_prompt
+
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.cache = ScoreCache(cache_path) if cache_path is not None else None
+
+    async def score_pairs(self, pairs: List[Tuple[str, str]], prompt: str,
+                          labels: Tuple[str, str] = ('Question', 'Answer'),
+                          max_tokens: int = 256) -> List[Optional[float]]:
+        keys = [self._key(self._pair_content(pair, labels), prompt) for pair in pairs]
+        scores = await asyncio.to_thread(self.cache.get_many, keys) if self.cache is not None else [None] * len(keys)
+
+        missing = [i for i, score in enumerate(scores) if score is None]
+        chunks = [missing[start:start + self.pairs_per_prompt]
+                  for start in range(0, len(missing), self.pairs_per_prompt)]
+
+        async with aiohttp.ClientSession() as session:
+            results = await asyncio.gather(*[
+                self._score_chunk(session, [pairs[i] for i in chunk], prompt, labels, max_tokens) for chunk in chunks
+            ])
+
+        for chunk, chunk_scores in zip(chunks, results):
+            for i, score in zip(chunk, chunk_scores):
+                scores[i] = score
+
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.put_many, [(keys[i], scores[i]) for i in missing
+                                                          if scores[i] is not None])
+
+        return scores
+
+    async def _score_chunk(self, session: aiohttp.ClientSession, pairs: List[Tuple[str, str]], prompt: str,
+                           labels: Tuple[str, str], max_tokens: int) -> List[Optional[float]]:
+        content = self._packed_content(pairs, prompt, labels)
+
+        try:
+            response = await self._complete(session, content, max_tokens)
+        except Exception as e:
+            print("Evaluation request failed:", repr(e))
+            return [None] * len(pairs)
+
+        return self.parse_scores(response, len(pairs))
+
+    async def _complete(self, session: aiohttp.ClientSession, content: str, max_tokens: int) -> str:
+        payload = {
+            'model': self.model,
+            'messages': [{'role': 'system', 'content': SYSTEM_PROMPT}, {'role': 'user', 'content': content}],
+            'temperature': 0.2,
+            'max_tokens': max_tokens
+        }
+        headers = {'Authorization': f'Bearer {self.api_key}'}
+
+        for attempt in range(self.max_retries + 1):
+            await self.requests.acquire()
+            await self.tokens.acquire(len(content) // 4 + max_tokens)
+
+            try:
+                async with session.post(f'{self.base_url}/chat/completions', json=payload, headers=headers) as response:
+                    if response.status == 200:
+                        data = await response.json()
+                        return data['choices'][0]['message']['content']
+
+                    if response.status != 429 and response.status < 500:
+                        raise RuntimeError(f'Evaluation request failed with status code {response.status}')
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == self.max_retries:
+                    raise e
+
+            await asyncio.sleep(self.backoff_seconds * 2 ** attempt * random.uniform(0.5, 1.5))
+
+        raise RuntimeError(f'Evaluation request failed after {self.max_retries + 1} attempts')
+
+    @staticmethod
+    def parse_scores(response: str, size: int) -> List[Optional[float]]:
+        scores: List[Optional[float]] = [None] * size
+
+        for line in response.splitlines():
+            match = SCORE_PATTERN.match(line)
+            if match is not None and 1 <= int(match.group(1)) <= size:
+                scores[int(match.group(1)) - 1] = float(match.group(2))
+
+        if size == 1 and scores[0] is None:
+            numbers = re.findall(r'\d+(?:\.\d+)?', response)
+            scores[0] = float(numbers[0]) if numbers else None
+
+        return scores
+
+    @staticmethod
+    def _pair_content(pair: Tuple[str, str], labels: Tuple[str, str]) -> str:
+        return f'[{labels[0]}]\n{pair[0]}\n\n[{labels[1]}]\n{pair[1]}\n\n'
+
+    def _packed_content(self, pairs: List[Tuple[str, str]], prompt: str, labels: Tuple[str, str]) -> str:
+        content = ''.join(f'[Pair {i}]\n{self._pair_content(pair, labels)}' for i, pair in enumerate(pairs, start=1))
+        return (f'{content}[System]\n{prompt}\n'
+                f'Rate each of the {len(pairs)} pairs independently. Output exactly {len(pairs)} lines, '
+                f'one per pair, formatted as "<pair number>: <score>" and nothing else.\n\n')
+
+    def _key(self, content: str, prompt: str) -> str:
+        return hashlib.sha256(json.dumps([self.model, SYSTEM_PROMPT, content, prompt]).encode('utf-8')).hexdigest()
@@ -1,13 +1,10 @@
-import os
 import ray
 import time
 import openai
 
 from typing import List
 
-from configs.configs import NUM_SECONDS_TO_SLEEP, GPT_OPENAI_API_KEY, GPT_EVALUATION_QUESTIONS_RELEVANCE_PROMPT
-
-os.environ['OPENAI_API_KEY'] = GPT_OPENAI_API_KEY
+from configs.configs import NUM_SECONDS_TO_SLEEP, GPT_EVALUATION_QUESTIONS_RELEVANCE_PROMPT
 
 
 @ray.remote(num_cpus=1)
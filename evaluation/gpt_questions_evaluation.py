@@ -1,12 +1,9 @@
-import os
+from typing import List, Dict, Optional
 
-from typing import List, Dict
-
-from configs.configs import GPT_EVALUATION_QUESTIONS_PROMPT, GPT_OPENAI_API_KEY
+from configs.configs import GPT_EVALUATION_QUESTIONS_PROMPT
+from evaluation.gpt_client import GPTEvaluationClient
 from gpt_evaluation import get_eval
 
-os.environ['OPENAI_API_KEY'] = GPT_OPENAI_API_KEY
-
 
 def create_contents(pairs: List[Dict[str, str]], prompt: str):
     contents = []
@@ -28,3 +25,10 @@ def questions_eval(questions: List[Dict], max_tokens: int, prompt: str = GPT_EVA
         handles.append(get_eval.remote(content, max_tokens))
 
     return handles
+
+
+async def questions_eval_async(pairs: List[Dict], prompt: str = GPT_EVALUATION_QUESTIONS_PROMPT, max_tokens: int = 256,
+                               client: GPTEvaluationClient = None) -> List[Optional[float]]:
+    client = client or GPTEvaluationClient()
+    flat_pairs = [(first, second) for pair in pairs for first, second in pair.items()]
+    return await client.score_pairs(flat_pairs, prompt, labels=('Question1', 'Question2'), max_tokens=max_tokens)
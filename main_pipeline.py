@@ -1,4 +1,6 @@
 import asyncio
+import uuid
+import ray
 import aiohttp
 import requests
 import json
@@ -6,95 +8,236 @@ import json
 import pandas as pd
 import numpy as np
 
-from evaluation.gpt_questions_evaluation import questions_eval
-from evaluation.gpt_vqa_evaluation import vqa_eval
-from typing import Dict, List
+from model.dispatcher import create_dispatcher
+from model.job_journal import JobJournal
+from model.metrics import new_trace_id, timed, trace_headers
+from evaluation.gpt_client import GPTEvaluationClient
+from evaluation.gpt_questions_evaluation import questions_eval, questions_eval_async
+from evaluation.gpt_vqa_evaluation import vqa_eval, vqa_eval_async
+from typing import AsyncIterator, Dict, List, Optional, Union
 
-from configs.configs import LLAVA_URLS, EVALUATION_ON, FAISS_APPLICATION_URL, MAIN_PIPELINE_TIMEOUT
+from configs.configs import (LLAVA_URLS, EVALUATION_ON, FAISS_APPLICATION_URL, MAIN_PIPELINE_TIMEOUT,
+                             VQA_QUESTION_SUFFIX, DISPATCHER_MAX_IN_FLIGHT, GPT_EVALUATION_ASYNC, EXTRACTION_MODE)
 
 
 class Controller:
-    def __init__(self, rudolph_urls=None, llava_urls=LLAVA_URLS, qa_eval_df: pd.DataFrame = None):
+    def __init__(self, rudolph_urls=None, llava_urls=LLAVA_URLS, qa_eval_df: pd.DataFrame = None,
+                 faiss_url: str = FAISS_APPLICATION_URL[0], dataset_id: str = None,
+                 extraction_mode: str = EXTRACTION_MODE):
         self.llava_urls = llava_urls
+        self.faiss_url = faiss_url
+        self.dataset_id = dataset_id
+        self.session_id: str = None
         self.rudolph_urls = rudolph_urls if rudolph_urls is not None else []
         self.evaluation_on = EVALUATION_ON
+        self.extraction_mode = extraction_mode
+        self.fallback_cells = 0
         self.columns = []
         self.vqa_evaluation = []
         self.qa_eval_df = qa_eval_df
+        self.dispatcher = create_dispatcher(self.llava_urls + self.rudolph_urls)
+        self.jobs: Dict[str, JobJournal] = {}
 
-    async def main_pipeline(self, image_files: List[str], user_columns: List[str] = None):
-        self.columns = user_columns if user_columns is not None else []
+    async def main_pipeline(self, image_files: List[str], user_columns: List[str] = None,
+                            column_types: Dict[str, Union[str, List[str]]] = None):
+        rows = [row async for row in self.stream_rows(image_files, user_columns, column_types=column_types)]
 
-        columns = json.loads(
-            requests.post(f'{FAISS_APPLICATION_URL[0]}/fill_questions_db/',
-                          data={"image_files": ' '.join(image_files)}, timeout=MAIN_PIPELINE_TIMEOUT).text)
-        self.columns += columns
+        questions_evaluation, vqa_evaluation = await self._evaluate() if self.evaluation_on else ([], [])
 
-        answers_ordered = {column: {} for column in self.columns}
-        tasks = []
+        return {"questions_evaluation": questions_evaluation, "vqa_evaluation": vqa_evaluation,
+                "dataframe": self._create_dataframe(rows)}
+
+    async def run_job(self, job_id: str, image_files: List[str] = None, user_columns: List[str] = None,
+                      column_types: Dict[str, Union[str, List[str]]] = None,
+                      sink=None) -> Union[pd.DataFrame, Dict]:
+        journal = JobJournal(job_id)
+        if not journal.load() and image_files is None:
+            raise ValueError(f"Job {job_id} doesn't exist and no image files were given.")
+        self.jobs[job_id] = journal
+
+        rows = []
+        try:
+            async for row in self.stream_rows(image_files, user_columns, column_types=column_types, journal=journal):
+                if sink is not None:
+                    sink.write(row)
+                else:
+                    rows.append(row)
+        except BaseException:
+            journal.fail()
+            raise
+        finally:
+            if sink is not None:
+                sink.close()
+
+        journal.finish()
+        return self._create_dataframe(rows) if sink is None else journal.progress
+
+    def close(self):
+        self.dispatcher.close()
+
+    def job_progress(self, job_id: str) -> Optional[Dict]:
+        if job_id in self.jobs:
+            return self.jobs[job_id].progress
+
+        journal = JobJournal(job_id)
+        return journal.progress if journal.load() else None
+
+    async def stream_rows(self, image_files: List[str], user_columns: List[str] = None,
+                          window: int = DISPATCHER_MAX_IN_FLIGHT * 2,
+                          column_types: Dict[str, Union[str, List[str]]] = None,
+                          journal: JobJournal = None) -> AsyncIterator[Dict]:
+        new_trace_id()
+        if journal is not None and journal.exists():
+            image_files, self.columns, column_types = journal.image_files, journal.columns, journal.column_types
+        else:
+            self._fill_columns(image_files, user_columns)
+            if journal is not None:
+                journal.create(image_files, self.columns, column_types)
+
+        if journal is not None:
+            journal.start()
+
+        questions = {column + VQA_QUESTION_SUFFIX: column for column in self.columns}
+        column_types = column_types or {}
+        answer_types = {question: column_types[column] for question, column in questions.items()
+                        if column in column_types}
 
         async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=MAIN_PIPELINE_TIMEOUT)) as session:
-            for i, image_file in enumerate(image_files):
-                url = self._distribute_questions_creation(i, "create_vqa")
-                vqa_evaluation_pairs = []
-
-                for question in self.columns:
-                    task = asyncio.ensure_future(
-                        self._request_vqa_handler(session=session, url=url, answers=answers_ordered, index=i,
-                                                  payload={"image_file": image_file,
-                                                           "question": question + ' Please answer one number, word or phrase.'},
-                                                  vqa_evaluation_handles=vqa_evaluation_pairs)
-                    )
-
-                    tasks.append(task)
-
-                self.vqa_evaluation += vqa_evaluation_pairs
-
-            await asyncio.gather(*tasks)
-
-        questions_evaluation = self._eval_question_pairs() if self.evaluation_on else []
-        vqa_evaluation = vqa_eval(self.vqa_evaluation, max_tokens=2048) if self.evaluation_on else []
+            images = iter(enumerate(image_files))
+            pending = set()
+
+            while True:
+                for i, image_file in images:
+                    row_questions = questions
+                    if journal is not None:
+                        missing = set(journal.missing(i))
+                        if not missing:
+                            yield journal.row(i)
+                            continue
+
+                        row_questions = {question: column for question, column in questions.items()
+                                         if column in missing}
+
+                    pending.add(asyncio.ensure_future(
+                        self._request_row(session=session, index=i, image_file=image_file, questions=row_questions,
+                                          answer_types=answer_types, journal=journal)))
+                    if len(pending) >= window:
+                        break
+
+                if not pending:
+                    break
+
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+
+    async def write_rows(self, image_files: List[str], sink, user_columns: List[str] = None,
+                         column_types: Dict[str, Union[str, List[str]]] = None) -> int:
+        written = 0
+
+        with sink:
+            async for row in self.stream_rows(image_files, user_columns, column_types=column_types):
+                sink.write(row)
+                written += 1
+
+        return written
+
+    def _fill_columns(self, image_files: List[str], user_columns: List[str] = None):
+        self.columns = list(user_columns) if user_columns is not None else []
+        self.session_id = self.dataset_id or uuid.uuid4().hex
+
+        with timed('fill_columns'):
+            columns = json.loads(
+                requests.post(f'{self.faiss_url}/fill_questions_db/',
+                              data={"image_files": ' '.join(image_files), "dataset_id": self.session_id,
+                                    "persist": self.dataset_id is not None},
+                              headers=trace_headers(),
+                              timeout=MAIN_PIPELINE_TIMEOUT).text)
+        self.columns += columns
 
-        return {"questions_evaluation": questions_evaluation, "vqa_evaluation": vqa_evaluation,
-                "dataframe": self._create_dataframe(answers_ordered)}
+    def _create_dataframe(self, rows: List[Dict]):
+        rows = sorted(rows, key=lambda row: row['index'])
+        return pd.DataFrame(rows, columns=self.columns)
+
+    async def _request_row(self, session: aiohttp.ClientSession, index: int, image_file: str,
+                           questions: Dict[str, str], answer_types: Dict[str, Union[str, List[str]]],
+                           journal: JobJournal = None) -> Dict:
+        row = journal.row(index) if journal is not None else \
+            {"index": index, "image_file": image_file, **{column: None for column in questions.values()}}
+
+        answers, failed = {}, 0
+        with timed('controller_row'):
+            if self.extraction_mode == 'single_pass':
+                answers = await self._extract_row(session, image_file, questions, answer_types)
+                questions = {question: column for question, column in questions.items() if column not in answers}
+                self.fallback_cells += len(questions)
+
+            if questions:
+                payload = {"image_file": image_file, "questions": json.dumps(list(questions)),
+                           "answer_types": json.dumps({question: answer_types[question] for question in questions
+                                                       if question in answer_types})}
+                data = await self.dispatcher.post(session, 'create_vqa_batch', payload)
+
+                if data is None:
+                    failed = len(questions)
+                else:
+                    for question, answer in data['answers'].items():
+                        if self.evaluation_on and np.random.choice([False, True]):
+                            self.vqa_evaluation.append({question: answer})
+
+                        answers[questions[question]] = answer['outputs'].removesuffix('</s>').strip()
+
+        if journal is not None:
+            if failed:
+                journal.record_failure(failed)
+            if answers:
+                journal.record(index, image_file, answers)
+        row.update(answers)
+
+        return row
+
+    async def _extract_row(self, session: aiohttp.ClientSession, image_file: str, questions: Dict[str, str],
+                           answer_types: Dict[str, Union[str, List[str]]]) -> Dict[str, str]:
+        column_types = {column: answer_types[question] for question, column in questions.items()
+                        if question in answer_types}
+        payload = {"image_file": image_file, "columns": json.dumps(list(questions.values())),
+                   "column_types": json.dumps(column_types)}
+
+        data = await self.dispatcher.post(session, 'create_table_row', payload)
+        if data is None:
+            return {}
+
+        answers = {column: answer for column, answer in data['fields'].items() if answer is not None}
+        if self.evaluation_on:
+            for question, column in questions.items():
+                if column in answers and np.random.choice([False, True]):
+                    self.vqa_evaluation.append({question: {"prompt": question, "outputs": answers[column]}})
+
+        return answers
+
+    async def _evaluate(self):
+        if not GPT_EVALUATION_ASYNC:
+            handles = (questions_eval(self._question_pairs(), max_tokens=2048),
+                       vqa_eval(self.vqa_evaluation, max_tokens=2048))
+            return [await asyncio.to_thread(self._scores, chunk) for chunk in handles]
+
+        client = GPTEvaluationClient()
+        pairs = await asyncio.to_thread(self._question_pairs)
+        return await asyncio.gather(questions_eval_async(pairs, client=client),
+                                    vqa_eval_async(self.vqa_evaluation, client=client))
 
     @staticmethod
-    def _create_dataframe(answers: Dict[str, Dict]):
-        data = {}
-
-        for column, responses_ordered in answers.items():
-            values = []
-            for task_id, response in dict(sorted(responses_ordered.items())).items():
-                values.append(response['outputs'].rstrip('</s>'))
-
-            data[column] = values
-
-        return pd.DataFrame(data)
-
-    async def _request_vqa_handler(self, session: aiohttp.ClientSession, url, payload,
-                                   answers: Dict[str, Dict[int, str]], index: int, vqa_evaluation_handles: List):
-        async with session.post(url, data=payload) as response:
-            if response.status == 200:
-                data = await response.json()
-
-                if self.evaluation_on and np.random.choice([False, True]):
-                    vqa_evaluation_handles.append({data['question']: data['answer']})
-
-                answers[data['question'].rstrip(' Please answer one number, word or phrase.')][index] = data['answer']
-            else:
-                print("Request failed with status code:", response.status)
-
-    def _distribute_questions_creation(self, index: int, endpoint: str) -> str:
-        urls = self.llava_urls + self.rudolph_urls
-        return urls[index % len(urls)] + f'/{endpoint}/'
+    def _scores(handles) -> List[Optional[float]]:
+        return [GPTEvaluationClient.parse_scores(response, 1)[0] for response in ray.get(handles)]
 
-    def _eval_question_pairs(self):
+    def _question_pairs(self) -> List[Dict[str, str]]:
         questions_from_files = list(self.qa_eval_df['question'].values) if self.qa_eval_df is not None else []
 
         pairs = []
         for question in list(np.random.choice(questions_from_files, size=min(len(questions_from_files), 3))):
-            pair = json.loads(requests.get(f'{FAISS_APPLICATION_URL[0]}/get_nearest_question/',
-                                           data={'question': question}).text)
+            pair = json.loads(requests.get(f'{self.faiss_url}/get_nearest_question/',
+                                           data={'question': question, 'dataset_id': self.session_id},
+                                           headers=trace_headers()).text)
             pairs.append(pair)
 
-        return questions_eval(pairs, max_tokens=2048)
+        return pairs
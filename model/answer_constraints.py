@@ -0,0 +1,47 @@
+import re
+
+from typing import List, Optional, Union
+
+
+class NumericConstraint:
+    PATTERN = re.compile(r'▁?[0-9]+|▁?[.,\-]')
+
+    def __init__(self, tokenizer):
+        self.eos_token_id = tokenizer.eos_token_id
+        self.token_ids = [token_id for token, token_id in tokenizer.get_vocab().items()
+                          if self.PATTERN.fullmatch(token)]
+
+    def allowed(self, generated: List[int]) -> Optional[List[int]]:
+        return self.token_ids + [self.eos_token_id] if generated else self.token_ids
+
+
+class ChoiceConstraint:
+    def __init__(self, tokenizer, choices: List[str]):
+        self.eos_token_id = tokenizer.eos_token_id
+        self.trie = {}
+
+        for choice in choices:
+            node = self.trie
+            for token_id in tokenizer.encode(choice, add_special_tokens=False):
+                node = node.setdefault(token_id, {})
+            node[None] = {}
+
+    def allowed(self, generated: List[int]) -> Optional[List[int]]:
+        node = self.trie
+        for token_id in generated:
+            if token_id not in node:
+                return None
+            node = node[token_id]
+
+        return [self.eos_token_id if token_id is None else token_id for token_id in node]
+
+
+def create_constraint(tokenizer, answer_type: Union[str, List[str], None]):
+    if answer_type is None:
+        return None
+    if answer_type == 'numeric':
+        return NumericConstraint(tokenizer)
+    if isinstance(answer_type, list):
+        return ChoiceConstraint(tokenizer, answer_type)
+
+    raise ValueError(f"Unknown answer type {answer_type}, expected 'numeric' or a list of choices.")
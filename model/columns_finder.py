@@ -1,39 +1,74 @@
+import os
 import asyncio
 import aiohttp
 import re
 import heapq
+import time
 
-import pandas as pd
 import numpy as np
 
-from typing import List, Dict
+from typing import List, Dict, Optional
 
-from langchain.document_loaders import DataFrameLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.embeddings import HuggingFaceEmbeddings
 from langchain.vectorstores import FAISS
 
+from model.dispatcher import create_dispatcher
+from model.question_index import QuestionIndex
+from model.embedding_cache import CachedEmbeddings
+from model.lazy_loader import LazyLoader
+from model.metrics import timed
 from configs.configs import (
+    EMBEDDINGS_MODEL_NAME,
+    EMBEDDINGS_DEVICE,
+    EMBEDDINGS_BATCH_SIZE,
+    EMBEDDINGS_CACHE_DIR,
+    QUESTION_INDEX_TYPE,
+    QUESTION_CLUSTER_THRESHOLD,
     DEFAULT_COLUMNS_QUANTITY,
     DEFAULT_IMAGE_QUANTITY_DELIMETER,
-    DEFAULT_IMAGE_VALIDATION
+    DEFAULT_IMAGE_VALIDATION,
+    COLUMN_DISCOVERY_MODE,
+    ADAPTIVE_SEED_IMAGES,
+    ADAPTIVE_ROUND_SIZE,
+    ADAPTIVE_STABLE_ROUNDS,
+    ADAPTIVE_CONFIDENCE_Z,
+    ADAPTIVE_MAX_CALLS,
+    ADAPTIVE_TIME_BUDGET_SECONDS
 )
 
 
 class SentenceTransformerEmbeddings:
-    def __init__(self):
-        model_name = "sentence-transformers/all-mpnet-base-v2"
-        model_kwargs = {'device': 'cuda'}
-        encode_kwargs = {'normalize_embeddings': False}
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name=model_name,
+    def __init__(
+            self,
+            model_name: str = EMBEDDINGS_MODEL_NAME,
+            device: str = EMBEDDINGS_DEVICE,
+            batch_size: int = EMBEDDINGS_BATCH_SIZE,
+            cache_dir: str = EMBEDDINGS_CACHE_DIR
+    ):
+        self.model_name = model_name
+        self.device = device
+        self.batch_size = batch_size
+        self.cache_dir = cache_dir
+        self.loader = LazyLoader(self._load)
+
+    def _load(self):
+        model_kwargs = {'device': self.device}
+        encode_kwargs = {'normalize_embeddings': False, 'batch_size': self.batch_size}
+        embeddings = HuggingFaceEmbeddings(
+            model_name=self.model_name,
             model_kwargs=model_kwargs,
             encode_kwargs=encode_kwargs
         )
 
+        if self.cache_dir is not None:
+            embeddings = CachedEmbeddings(embeddings, os.path.join(self.cache_dir, self.model_name.replace('/', '--')),
+                                          batch_size=self.batch_size)
+
+        return embeddings
+
     @property
     def get_embeddings(self):
-        return self.embeddings
+        return self.loader.get()
 
 
 class ColumnsFinder:
@@ -41,48 +76,170 @@ class ColumnsFinder:
             self,
             llava_endpoints: List[str],
             top_k: int = DEFAULT_COLUMNS_QUANTITY,
-            embeddings=SentenceTransformerEmbeddings()
+            embeddings: SentenceTransformerEmbeddings = None,
+            index_type: str = QUESTION_INDEX_TYPE,
+            cluster_threshold: float = QUESTION_CLUSTER_THRESHOLD,
+            discovery_mode: str = COLUMN_DISCOVERY_MODE,
+            dispatcher=None
     ):
+        if discovery_mode not in ('fixed', 'adaptive'):
+            raise ValueError(f"Unknown discovery mode {discovery_mode}, expected 'fixed' or 'adaptive'.")
+
         self.llava_endpoints = llava_endpoints
+        self.dispatcher = dispatcher if dispatcher is not None else create_dispatcher(llava_endpoints)
         self.top_k = top_k
-        self.embeddings = embeddings.get_embeddings
+        self.embeddings_provider = embeddings if embeddings is not None else SentenceTransformerEmbeddings()
+        self.index_type = index_type
+        self.cluster_threshold = cluster_threshold
+        self.discovery_mode = discovery_mode
+        self.discovery_stats = {}
 
         self.questions_stash = []
         self.question_db: FAISS = None
+        self.question_index: QuestionIndex = None
+
+    @property
+    def embeddings(self):
+        return self.embeddings_provider.get_embeddings
+
+    @property
+    def ready(self) -> bool:
+        return self.embeddings_provider.loader.ready
+
+    def load(self):
+        self.embeddings_provider.loader.start()
+
+    def warmup(self):
+        self.embeddings.embed_query('What is shown in the picture?')
+
+    def load_index(self, dataset_id: str) -> bool:
+        self.question_index = QuestionIndex(self.embeddings, dataset_id=dataset_id, index_type=self.index_type)
+        if not self.question_index.load():
+            return False
+
+        self.questions_stash = list(self.question_index.questions)
+        self.question_db = self.question_index.store
+        return True
+
+    async def create_faiss_questions(self, image_files: List[str], dataset_id: str = None,
+                                     size: Optional[int] = None):
+        if await asyncio.to_thread(self.load_index, dataset_id):
+            return self.question_index.metadata.get('images_minibatch', [])
 
-    async def create_faiss_questions(self, image_files: List[str]):
         images_minibatch = list(np.random.choice(
             image_files,
-            size=max(len(image_files) // DEFAULT_IMAGE_QUANTITY_DELIMETER, 1)
+            size=min(size or max(len(image_files) // DEFAULT_IMAGE_QUANTITY_DELIMETER, 1), len(image_files)),
+            replace=False
         ))
         await self.__fill_questions_stash(images_minibatch, self.questions_stash)
 
-        data = pd.DataFrame({'questions': self.questions_stash, 'counts': [0] * len(self.questions_stash)})
-        loader = DataFrameLoader(data, page_content_column='questions')
-        documents = loader.load()
+        self.question_index.metadata['images_minibatch'] = images_minibatch
+        await asyncio.to_thread(self.add_questions, self.questions_stash)
 
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
-        texts = text_splitter.split_documents(documents)
+        return images_minibatch
 
-        self.question_db = FAISS.from_documents(texts, self.embeddings)
+    def add_questions(self, questions: List[str]) -> int:
+        if self.question_index is None:
+            self.question_index = QuestionIndex(self.embeddings, index_type=self.index_type)
 
-        return images_minibatch
+        added = self.question_index.add(questions)
+        self.question_db = self.question_index.store
+        known = set(self.questions_stash)
+        self.questions_stash += [question for question in dict.fromkeys(questions) if question not in known]
+        self.question_index.save()
 
-    async def create_column_names(self, image_files: List[str]) -> List[str]:
-        images_minibatch = await self.create_faiss_questions(image_files)
-        questions_semantic_counter = {question: 0 for question in self.questions_stash}
+        return added
 
+    async def create_column_names(self, image_files: List[str], dataset_id: str = None) -> List[str]:
+        if self.discovery_mode == 'adaptive':
+            return await self.create_column_names_adaptive(image_files, dataset_id)
+
+        images_minibatch = set(await self.create_faiss_questions(image_files, dataset_id))
+
+        remaining = [image_file for image_file in image_files if image_file not in images_minibatch]
         validation_images = np.random.choice(
-            validation_qeustions := [question for question in image_files if question not in images_minibatch],
-            size=max(len(validation_qeustions) // DEFAULT_IMAGE_VALIDATION, 1)
-        )
+            remaining,
+            size=max(len(remaining) // DEFAULT_IMAGE_VALIDATION, 1),
+            replace=False
+        ) if remaining else []
         validation_questions = []
         await self.__fill_questions_stash(validation_images, validation_questions)
+        self.discovery_stats = {"mode": 'fixed', "calls": len(images_minibatch) + len(validation_images)}
+
+        return self.__top_k_frequently_questions(await asyncio.to_thread(self._count_questions, validation_questions))
+
+    async def create_column_names_adaptive(
+            self,
+            image_files: List[str],
+            dataset_id: str = None,
+            seed_images: int = ADAPTIVE_SEED_IMAGES,
+            round_size: int = ADAPTIVE_ROUND_SIZE,
+            stable_rounds: int = ADAPTIVE_STABLE_ROUNDS,
+            confidence_z: float = ADAPTIVE_CONFIDENCE_Z,
+            max_calls: int = ADAPTIVE_MAX_CALLS,
+            time_budget: float = ADAPTIVE_TIME_BUDGET_SECONDS
+    ) -> List[str]:
+        start = time.monotonic()
+        seed_size = min(seed_images, max(len(image_files) // DEFAULT_IMAGE_QUANTITY_DELIMETER, 1))
+        images_minibatch = set(await self.create_faiss_questions(image_files, dataset_id, size=seed_size))
+
+        remaining = np.random.permutation([image_file for image_file in image_files
+                                           if image_file not in images_minibatch]).tolist()
+        representatives = await asyncio.to_thread(self._representatives)
+        counter = {representative: 0 for representative in representatives.values()}
+        calls, rounds, stable, ranking, reason = len(images_minibatch), 0, 0, [], 'exhausted'
+
+        while remaining:
+            if calls >= max_calls:
+                reason = 'max_calls'
+                break
+            if time.monotonic() - start >= time_budget:
+                reason = 'time_budget'
+                break
+
+            size = min(round_size, max_calls - calls)
+            round_images, remaining = remaining[:size], remaining[size:]
+            round_questions = []
+            await self.__fill_questions_stash(round_images, round_questions)
+            calls += len(round_images)
+            rounds += 1
 
-        for question in validation_questions:
-            questions_semantic_counter[self.question_db.max_marginal_relevance_search(question)[0].page_content] += 1
+            counter = await asyncio.to_thread(self._count_questions, round_questions, representatives, counter)
+            previous, ranking = ranking, self.__top_k_frequently_questions(counter)
+            stable = stable + 1 if ranking == previous else 0
 
-        return self.__top_k_frequently_questions(questions_semantic_counter)
+            if stable >= stable_rounds and self._ranking_confident(counter, confidence_z):
+                reason = 'converged'
+                break
+
+        self.discovery_stats = {"mode": 'adaptive', "calls": calls, "rounds": rounds, "reason": reason,
+                                "seconds": time.monotonic() - start}
+        return ranking if rounds else self.__top_k_frequently_questions(counter)
+
+    def _ranking_confident(self, counter: Dict[str, int], confidence_z: float) -> bool:
+        counts = sorted(counter.values(), reverse=True)
+        if len(counts) <= self.top_k:
+            return True
+
+        inside, outside = counts[self.top_k - 1], counts[self.top_k]
+        return inside > outside and (inside - outside) / np.sqrt(inside + outside) >= confidence_z
+
+    def _representatives(self) -> Dict[str, str]:
+        if self.cluster_threshold is not None:
+            return self.question_index.cluster(self.cluster_threshold)
+        return {question: question for question in self.question_index.questions}
+
+    def _count_questions(self, validation_questions: List[str], representatives: Dict[str, str] = None,
+                         counter: Dict[str, int] = None) -> Dict[str, int]:
+        representatives = representatives if representatives is not None else self._representatives()
+        questions_semantic_counter = dict(counter) if counter is not None else \
+            {representative: 0 for representative in representatives.values()}
+
+        for nearest in self.question_index.nearest(validation_questions):
+            if nearest is not None:
+                questions_semantic_counter[representatives[nearest]] += 1
+
+        return questions_semantic_counter
 
     def __top_k_frequently_questions(self, questions: Dict[str, int]) -> List[str]:
         heap = [(-value, key) for key, value in questions.items()]
@@ -94,22 +251,17 @@ class ColumnsFinder:
         tasks = []
 
         async with aiohttp.ClientSession() as session:
-            for i, image_file in enumerate(image_files):
-                url = self._distribute_questions_creation(i, 'create_questions')
-
-                task = asyncio.ensure_future(
-                    self._request_handler(session, url, {"image_file": image_file}, questions_stash))
+            for image_file in image_files:
+                task = asyncio.ensure_future(self._request_handler(session, {"image_file": image_file}, questions_stash))
                 tasks.append(task)
 
-            await asyncio.gather(*tasks)
+            with timed('create_questions', items=len(tasks)):
+                await asyncio.gather(*tasks)
 
-    async def _request_handler(self, session: aiohttp.ClientSession, url, payload, questions_stash: List[str]):
-        async with session.post(url, data=payload) as response:
-            if response.status == 200:
-                data = await response.json()
-                self._unpack_questions_request(data, questions_stash)
-            else:
-                print("Request failed with status code:", response.status)
+    async def _request_handler(self, session: aiohttp.ClientSession, payload, questions_stash: List[str]):
+        data = await self.dispatcher.post(session, 'create_questions', payload)
+        if data is not None:
+            self._unpack_questions_request(data, questions_stash)
 
     def _unpack_questions_request(self, response: Dict, questions_stash: List[str]):
         questions = list(map(self.__remove_tokens, response['questions']['outputs'].split('\n')))
@@ -119,9 +271,7 @@ class ColumnsFinder:
     def __remove_tokens(question: str) -> str:
         return re.sub(r'\d+\.\s*|<.*?>', '', question)
 
-    def _distribute_questions_creation(self, index: int, endpoint: str) -> str:
-        return self.llava_endpoints[index % len(self.llava_endpoints)] + f'/{endpoint}/'
-
     def clear_stash(self):
         self.questions_stash = []
         self.question_db = None
+        self.question_index = None
@@ -0,0 +1,51 @@
+import os
+
+import torch
+
+from typing import List, Optional
+
+QUANTIZATION_MODES = ('int8', 'bf16', None)
+
+
+def select_device(device: str = 'auto') -> str:
+    if device == 'auto':
+        return 'cuda' if torch.cuda.is_available() else 'cpu'
+    return device
+
+
+def configure_threads(intra_op_threads: int, inter_op_threads: int = 1):
+    torch.set_num_threads(intra_op_threads)
+
+    try:
+        torch.set_num_interop_threads(inter_op_threads)
+    except RuntimeError as e:
+        print("Inter-op threads were already configured:", repr(e))
+
+
+def pin_cores(worker_index: int, cores_per_worker: int) -> Optional[List[int]]:
+    if not hasattr(os, 'sched_setaffinity'):
+        return None
+
+    available = sorted(os.sched_getaffinity(0))
+    start = worker_index * cores_per_worker % len(available)
+    cores = [available[(start + offset) % len(available)] for offset in range(min(cores_per_worker, len(available)))]
+
+    os.sched_setaffinity(0, cores)
+    return cores
+
+
+def prepare_cpu_model(model: torch.nn.Module, quantization: Optional[str] = 'int8') -> torch.nn.Module:
+    if quantization not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown CPU quantization {quantization}, expected one of {QUANTIZATION_MODES}.")
+
+    if quantization == 'bf16':
+        return model.to(dtype=torch.bfloat16)
+
+    model = model.to(dtype=torch.float32)
+    if quantization == 'int8':
+        language_model = model.get_model()
+        torch.ao.quantization.quantize_dynamic(language_model.layers, {torch.nn.Linear}, dtype=torch.qint8,
+                                               inplace=True)
+        model.lm_head = torch.ao.quantization.quantize_dynamic(torch.nn.Sequential(model.lm_head),
+                                                               {torch.nn.Linear}, dtype=torch.qint8)[0]
+    return model
@@ -0,0 +1,169 @@
+import asyncio
+import random
+import time
+
+import aiohttp
+
+from typing import Dict, List, Optional
+
+from configs.configs import (
+    DISPATCHER_MAX_PER_ENDPOINT,
+    DISPATCHER_MAX_IN_FLIGHT,
+    DISPATCHER_MAX_RETRIES,
+    DISPATCHER_BACKOFF_SECONDS,
+    DISPATCHER_FAILURE_THRESHOLD,
+    DISPATCHER_EJECTION_SECONDS,
+    DISPATCHER_HEALTH_PATH,
+    INFERENCE_TRANSPORT
+)
+from model.metrics import DISPATCH_REQUESTS, DISPATCH_SECONDS, observe, trace_headers
+
+
+class Endpoint:
+    def __init__(self, url: str):
+        self.url = url.rstrip('/')
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.probing = False
+
+    @property
+    def ejected(self) -> bool:
+        return self.ejected_until > 0
+
+
+class Dispatcher:
+    def __init__(
+            self,
+            urls: List[str],
+            max_per_endpoint: int = DISPATCHER_MAX_PER_ENDPOINT,
+            max_in_flight: int = DISPATCHER_MAX_IN_FLIGHT,
+            max_retries: int = DISPATCHER_MAX_RETRIES,
+            backoff_seconds: float = DISPATCHER_BACKOFF_SECONDS,
+            failure_threshold: int = DISPATCHER_FAILURE_THRESHOLD,
+            ejection_seconds: float = DISPATCHER_EJECTION_SECONDS,
+            health_path: str = DISPATCHER_HEALTH_PATH
+    ):
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.max_per_endpoint = max_per_endpoint
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.failure_threshold = failure_threshold
+        self.ejection_seconds = ejection_seconds
+        self.health_path = health_path
+
+        self.failures: List[Dict] = []
+
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._released = asyncio.Condition()
+
+    async def post(self, session: aiohttp.ClientSession, endpoint: str, payload) -> Optional[Dict]:
+        with DISPATCH_SECONDS.labels(endpoint).time():
+            return await self._post(session, endpoint, payload)
+
+    async def _post(self, session: aiohttp.ClientSession, endpoint: str, payload) -> Optional[Dict]:
+        start = time.perf_counter()
+
+        async with self._in_flight:
+            for attempt in range(self.max_retries + 1):
+                target = await self._acquire(session)
+                observe('dispatch_queue', time.perf_counter() - start)
+                retry = True
+
+                try:
+                    async with session.post(f'{target.url}/{endpoint}/', data=payload,
+                                            headers=trace_headers()) as response:
+                        DISPATCH_REQUESTS.labels(endpoint, str(response.status)).inc()
+                        if response.status == 200:
+                            data = await response.json()
+                            await self._release(target, succeeded=True)
+                            return data
+
+                        print("Request failed with status code:", response.status, target.url)
+                        retry = response.status >= 500
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    DISPATCH_REQUESTS.labels(endpoint, type(e).__name__).inc()
+                    print("Request failed:", repr(e), target.url)
+
+                await self._release(target, succeeded=not retry)
+                if not retry or attempt == self.max_retries:
+                    break
+
+                await asyncio.sleep(self.backoff_seconds * 2 ** attempt * random.uniform(0.5, 1.5))
+                start = time.perf_counter()
+
+        self.failures.append({"endpoint": endpoint, "payload": payload})
+        return None
+
+    def close(self):
+        pass
+
+    @property
+    def stats(self) -> List[Dict]:
+        return [{"url": target.url, "outstanding": target.outstanding, "ejected": target.ejected,
+                 "consecutive_failures": target.consecutive_failures} for target in self.endpoints]
+
+    async def _acquire(self, session: aiohttp.ClientSession) -> Endpoint:
+        while True:
+            await self._readmit(session)
+
+            async with self._released:
+                candidates = [target for target in self.endpoints
+                              if not target.ejected and target.outstanding < self.max_per_endpoint]
+                if candidates:
+                    target = min(candidates, key=lambda candidate: candidate.outstanding)
+                    target.outstanding += 1
+                    return target
+
+                try:
+                    await asyncio.wait_for(self._released.wait(), timeout=self.ejection_seconds)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _release(self, target: Endpoint, succeeded: bool):
+        async with self._released:
+            target.outstanding -= 1
+
+            if succeeded:
+                target.consecutive_failures = 0
+            else:
+                target.consecutive_failures += 1
+                if target.consecutive_failures >= self.failure_threshold and not target.ejected and \
+                        any(not candidate.ejected for candidate in self.endpoints if candidate is not target):
+                    print("Ejecting endpoint:", target.url)
+                    target.ejected_until = time.monotonic() + self.ejection_seconds
+
+            self._released.notify_all()
+
+    async def _readmit(self, session: aiohttp.ClientSession):
+        for target in self.endpoints:
+            if not target.ejected or target.probing or target.ejected_until > time.monotonic():
+                continue
+
+            target.probing = True
+            try:
+                async with session.get(target.url + self.health_path,
+                                       timeout=aiohttp.ClientTimeout(total=self.ejection_seconds)) as response:
+                    healthy = response.status == 200
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                healthy = False
+            finally:
+                target.probing = False
+
+            if healthy:
+                print("Re-admitting endpoint:", target.url)
+                target.ejected_until = 0.0
+                target.consecutive_failures = 0
+            else:
+                target.ejected_until = time.monotonic() + self.ejection_seconds
+
+
+def create_dispatcher(urls: List[str], transport: str = INFERENCE_TRANSPORT):
+    if transport == 'ray':
+        from model.ray_pool import RayDispatcher
+
+        return RayDispatcher()
+    if transport != 'http':
+        raise ValueError(f"Unknown inference transport {transport}, expected 'http' or 'ray'.")
+
+    return Dispatcher(urls)
@@ -0,0 +1,107 @@
+import os
+import json
+import hashlib
+import threading
+
+import numpy as np
+
+from typing import Dict, List
+
+from langchain.embeddings.base import Embeddings
+
+
+class CachedEmbeddings(Embeddings):
+    def __init__(self, embeddings: Embeddings, cache_dir: str, batch_size: int = 256, initial_capacity: int = 1024):
+        self.embeddings = embeddings
+        self.cache_dir = cache_dir
+        self.batch_size = batch_size
+        self.initial_capacity = initial_capacity
+
+        self.hits = 0
+        self.misses = 0
+
+        self._rows: Dict[str, int] = {}
+        self._vectors: np.memmap = None
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+
+    @property
+    def vectors_path(self) -> str:
+        return os.path.join(self.cache_dir, 'vectors.npy')
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.cache_dir, 'index.json')
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+
+        with self._lock:
+            missing = {key: text for key, text in zip(keys, texts) if key not in self._rows}
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+            if missing:
+                missing_keys, missing_texts = list(missing), list(missing.values())
+                for start in range(0, len(missing_texts), self.batch_size):
+                    vectors = self.embeddings.embed_documents(missing_texts[start:start + self.batch_size])
+                    self._append(missing_keys[start:start + self.batch_size], np.asarray(vectors, dtype=np.float32))
+                self._save_index()
+
+            return [self._vectors[self._rows[key]].tolist() for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._rows)}
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def _load(self):
+        if not (os.path.exists(self.index_path) and os.path.exists(self.vectors_path)):
+            return
+
+        with open(self.index_path) as file:
+            self._rows = json.load(file)
+        self._vectors = np.load(self.vectors_path, mmap_mode='r+')
+
+    def _append(self, keys: List[str], vectors: np.ndarray):
+        size = len(self._rows)
+        if self._vectors is not None and vectors.shape[1] != self._vectors.shape[1]:
+            raise ValueError(f"Embedding dimension {vectors.shape[1]} doesn't match cache dimension "
+                             f"{self._vectors.shape[1]} in {self.cache_dir}.")
+
+        if self._vectors is None or size + len(keys) > self._vectors.shape[0]:
+            self._grow(size + len(keys), vectors.shape[1])
+
+        self._vectors[size:size + len(keys)] = vectors
+        for offset, key in enumerate(keys):
+            self._rows[key] = size + offset
+
+    def _grow(self, required: int, dimension: int):
+        capacity = max(self.initial_capacity, required, 2 * (self._vectors.shape[0] if self._vectors is not None else 0))
+        tmp_path = self.vectors_path + '.tmp'
+
+        vectors = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=(capacity, dimension))
+        if self._vectors is not None:
+            vectors[:len(self._rows)] = self._vectors[:len(self._rows)]
+        vectors.flush()
+
+        del vectors
+        self._vectors = None
+        os.replace(tmp_path, self.vectors_path)
+        self._vectors = np.load(self.vectors_path, mmap_mode='r+')
+
+    def _save_index(self):
+        self._vectors.flush()
+
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(self._rows, file)
+        os.replace(tmp_path, self.index_path)
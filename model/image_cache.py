@@ -0,0 +1,164 @@
+import os
+import hashlib
+import threading
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Callable, Dict, Hashable, Tuple, Union
+
+import torch
+
+
+class SharedImage:
+    def __init__(self, name: str, width: int, height: int):
+        self.name = name
+        self.width = width
+        self.height = height
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.width, self.height
+
+    @contextmanager
+    def buffer(self):
+        memory = shared_memory.SharedMemory(name=self.name)
+        resource_tracker.unregister(memory._name, 'shared_memory')
+        view = memory.buf[:self.width * self.height * 3]
+
+        try:
+            yield view
+        finally:
+            view.release()
+            memory.close()
+
+    def digest(self) -> str:
+        with self.buffer() as view:
+            return hashlib.sha1(view).hexdigest()
+
+    def __eq__(self, other):
+        return isinstance(other, SharedImage) and (self.name, self.size) == (other.name, other.size)
+
+    def __hash__(self):
+        return hash((self.name, self.size))
+
+
+class ImageCache:
+    def __init__(self, max_bytes: int, on_evict: Callable[[Hashable], None] = None):
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.current_bytes = 0
+
+        self._entries: OrderedDict = OrderedDict()
+        self._loading: Dict[Hashable, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(source: Union[str, bytes, SharedImage]) -> Tuple:
+        if isinstance(source, SharedImage):
+            return 'sha1', source.digest()
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return 'sha1', hashlib.sha1(source).hexdigest()
+
+        stat = os.stat(source)
+        return os.path.abspath(source), stat.st_mtime_ns, stat.st_size
+
+    def get(self, key: Hashable):
+        with self._lock:
+            if key not in self._entries:
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][0]
+
+    def get_or_load(self, source: Union[str, bytes, SharedImage],
+                    loader: Callable[[Any], Any]) -> Tuple[Hashable, Any]:
+        key = self.make_key(source)
+
+        while True:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return key, self._entries[key][0]
+
+                event = self._loading.get(key)
+                if event is None:
+                    self.misses += 1
+                    self._loading[key] = threading.Event()
+                    break
+
+            event.wait()
+
+        try:
+            value = loader(source)
+            self.put(key, value)
+        finally:
+            with self._lock:
+                self._loading.pop(key).set()
+
+        return key, value
+
+    def put(self, key: Hashable, value):
+        size = self._size(value)
+        evicted = []
+
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+
+            if size > self.max_bytes:
+                return
+
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+
+            while self.current_bytes > self.max_bytes:
+                evicted_key, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+                evicted.append(evicted_key)
+
+        if self.on_evict is not None:
+            for evicted_key in evicted:
+                self.on_evict(evicted_key)
+
+    def evict(self, key: Hashable):
+        with self._lock:
+            if key not in self._entries:
+                return
+
+            self.current_bytes -= self._entries.pop(key)[1]
+            self.evictions += 1
+
+        if self.on_evict is not None:
+            self.on_evict(key)
+
+    def clear(self):
+        with self._lock:
+            evicted = list(self._entries)
+            self._entries.clear()
+            self.current_bytes = 0
+
+        if self.on_evict is not None:
+            for evicted_key in evicted:
+                self.on_evict(evicted_key)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self._entries), "bytes": self.current_bytes, "max_bytes": self.max_bytes}
+
+    @classmethod
+    def _size(cls, value) -> int:
+        if isinstance(value, torch.Tensor):
+            return value.element_size() * value.nelement()
+        if isinstance(value, (list, tuple)):
+            return sum(cls._size(item) for item in value)
+        return 0
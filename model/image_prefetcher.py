@@ -0,0 +1,41 @@
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Hashable, Iterable
+
+
+class ImagePrefetcher:
+    def __init__(self, former, max_workers: int = 4):
+        self.former = former
+        self.prefetched = 0
+        self.failed = 0
+
+        self._pending: Dict[Hashable, object] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='image-prefetch')
+        self._lock = threading.Lock()
+
+    def prefetch(self, sources: Iterable):
+        for source in sources:
+            with self._lock:
+                if source in self._pending:
+                    continue
+                self._pending[source] = self._executor.submit(self._load, source)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"pending": len(self._pending), "prefetched": self.prefetched, "failed": self.failed}
+
+    def _load(self, source):
+        try:
+            self.former.image_cache.get_or_load(source, self.former.image_tensor)
+            self.prefetched += 1
+        except Exception as e:
+            self.failed += 1
+            print("Prefetch failed:", repr(e))
+        finally:
+            with self._lock:
+                self._pending.pop(source, None)
@@ -0,0 +1,130 @@
+import os
+import asyncio
+import shutil
+import uuid
+
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from configs.configs import QUESTION_INDEX_MEMORY_BUDGET
+from model.columns_finder import ColumnsFinder
+from model.question_index import QuestionIndex
+
+
+class IndexRegistry:
+    def __init__(self, factory: Callable[[], ColumnsFinder], max_bytes: int = QUESTION_INDEX_MEMORY_BUDGET):
+        self.factory = factory
+        self.max_bytes = max_bytes
+
+        self.latest: Optional[str] = None
+        self.evictions = 0
+
+        self._finders: OrderedDict = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._building: Dict[str, int] = {}
+
+    @staticmethod
+    def new_dataset_id() -> str:
+        return uuid.uuid4().hex
+
+    async def build(self, dataset_id: str, image_files: List[str], rebuild: bool = False,
+                    persist: bool = True) -> List[str]:
+        async with self._lock(dataset_id):
+            self._building[dataset_id] = self._building.get(dataset_id, 0) + 1
+
+            try:
+                finder = self.factory()
+                if rebuild:
+                    await asyncio.to_thread(self._remove_persisted, dataset_id)
+
+                columns = await finder.create_column_names(image_files, dataset_id if persist else None)
+                self._finders[dataset_id] = finder
+                self._finders.move_to_end(dataset_id)
+                self.latest = dataset_id
+            finally:
+                self._building[dataset_id] -= 1
+
+        self._evict()
+        return columns
+
+    async def add_questions(self, dataset_id: str, questions: List[str]) -> int:
+        async with self._lock(dataset_id):
+            finder = await self.get(dataset_id)
+            if finder is None:
+                finder = self.factory()
+                await asyncio.to_thread(finder.load_index, dataset_id)
+                self._finders[dataset_id] = finder
+
+            added = await asyncio.to_thread(finder.add_questions, questions)
+
+        self._evict()
+        return added
+
+    async def get(self, dataset_id: str) -> Optional[ColumnsFinder]:
+        if dataset_id in self._finders:
+            self._finders.move_to_end(dataset_id)
+            return self._finders[dataset_id]
+
+        finder = self.factory()
+        if not await asyncio.to_thread(finder.load_index, dataset_id):
+            return None
+
+        self._finders[dataset_id] = finder
+        self._evict()
+        return finder
+
+    async def nearest(self, dataset_id: str, questions: List[str]) -> Optional[List[Optional[str]]]:
+        finder = await self.get(dataset_id)
+        if finder is None or finder.question_index is None:
+            return None
+
+        return await asyncio.to_thread(finder.question_index.nearest, questions)
+
+    async def drop(self, dataset_id: str) -> bool:
+        async with self._lock(dataset_id):
+            dropped = self._finders.pop(dataset_id, None) is not None
+            removed = await asyncio.to_thread(self._remove_persisted, dataset_id)
+
+        if self.latest == dataset_id:
+            self.latest = None
+        return dropped or removed
+
+    @property
+    def current_bytes(self) -> int:
+        return sum(self._size(finder) for finder in self._finders.values())
+
+    @property
+    def stats(self) -> Dict:
+        return {"resident": {dataset_id: self._size(finder) for dataset_id, finder in self._finders.items()},
+                "building": [dataset_id for dataset_id, count in self._building.items() if count],
+                "bytes": self.current_bytes, "max_bytes": self.max_bytes, "evictions": self.evictions,
+                "latest": self.latest}
+
+    def _lock(self, dataset_id: str) -> asyncio.Lock:
+        return self._locks.setdefault(dataset_id, asyncio.Lock())
+
+    def _evict(self):
+        current_bytes = self.current_bytes
+
+        for dataset_id in list(self._finders):
+            if current_bytes <= self.max_bytes or len(self._finders) <= 1:
+                break
+            if self._building.get(dataset_id) or dataset_id == self.latest:
+                continue
+
+            current_bytes -= self._size(self._finders.pop(dataset_id))
+            self.evictions += 1
+            print("Evicting question index:", dataset_id)
+
+    @staticmethod
+    def _size(finder: ColumnsFinder) -> int:
+        return finder.question_index.memory_bytes if finder.question_index is not None else 0
+
+    @staticmethod
+    def _remove_persisted(dataset_id: str) -> bool:
+        path = QuestionIndex(None, dataset_id=dataset_id).path
+        if not os.path.exists(path):
+            return False
+
+        shutil.rmtree(path, ignore_errors=True)
+        return True
@@ -0,0 +1,148 @@
+import asyncio
+import contextvars
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, List, Tuple, Union
+
+from model.image_cache import SharedImage
+from model.metrics import timed, trace_id
+
+
+class InferenceScheduler:
+    def __init__(self, former, max_batch_size: int = 16, max_wait_ms: float = 10, logging: bool = False,
+                 prefetcher=None, result_cache=None):
+        self.former = former
+        self.prefetcher = prefetcher
+        self.result_cache = result_cache
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.logging = logging
+
+        self.batch_sizes = Counter()
+        self.queue_depths = Counter()
+
+        self.queue: asyncio.Queue = None
+        self._worker: asyncio.Task = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def start(self):
+        if self._worker is None:
+            self.queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+        self._executor.shutdown(wait=False)
+        if self.prefetcher is not None:
+            self.prefetcher.shutdown()
+
+    async def submit(self, image_file: Union[str, bytes, SharedImage], input: str,
+                     temperature: float = 0.2, max_new_tokens: int = 512, refresh: bool = False,
+                     stop: Tuple[str, ...] = (), answer_type: Union[str, List[str], None] = None) -> Dict:
+        stop = tuple(stop)
+
+        key = None
+        if self.result_cache is not None and temperature == 0:
+            options = {"stop": stop, "answer_type": answer_type}
+            key = await asyncio.to_thread(self.result_cache.make_key, image_file, input, temperature, max_new_tokens,
+                                          options)
+            cached = await asyncio.to_thread(self.result_cache.get, key) if not refresh else None
+            if cached is not None:
+                return cached
+
+        if self.prefetcher is not None:
+            self.prefetcher.prefetch([image_file])
+
+        future = asyncio.get_running_loop().create_future()
+        with timed('scheduler_request'):
+            await self.queue.put(((image_file, input), (temperature, max_new_tokens, stop), answer_type,
+                                  trace_id.get(), future))
+            result = await future
+
+        if key is not None:
+            self.result_cache.put(key, result)
+
+        return result
+
+    async def submit_many(self, image_file: Union[str, bytes, SharedImage], inputs: List[str],
+                          temperature: float = 0.2, max_new_tokens: int = 512, refresh: bool = False,
+                          stop: Tuple[str, ...] = (),
+                          answer_types: Dict[str, Union[str, List[str]]] = None) -> Dict[str, Dict]:
+        inputs = list(dict.fromkeys(inputs))
+        answer_types = answer_types or {}
+        results = await asyncio.gather(*[self.submit(image_file, input, temperature, max_new_tokens, refresh,
+                                                     stop, answer_types.get(input))
+                                         for input in inputs])
+        return dict(zip(inputs, results))
+
+    async def run_exclusive(self, function, *args):
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, partial(context.run, function, *args))
+
+    @property
+    def stats(self) -> Dict:
+        return {"queue_depth": self.queue.qsize() if self.queue is not None else 0,
+                "prefetch": self.prefetcher.stats if self.prefetcher is not None else None,
+                "result_cache": self.result_cache.stats if self.result_cache is not None else None,
+                "queue_depth_histogram": dict(sorted(self.queue_depths.items())),
+                "batch_size_histogram": dict(sorted(self.batch_sizes.items()))}
+
+    async def _run(self):
+        while True:
+            batch = await self._collect_batch()
+            self.batch_sizes[len(batch)] += 1
+
+            groups: Dict[Tuple, List] = {}
+            for request, params, answer_type, trace, future in batch:
+                groups.setdefault(params, []).append((request, answer_type, trace, future))
+
+            for (temperature, max_new_tokens, stop), items in groups.items():
+                await self._run_group(items, temperature, max_new_tokens, stop)
+
+    async def _collect_batch(self) -> List:
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        self.queue_depths[self.queue.qsize()] += 1
+        deadline = loop.time() + self.max_wait_ms / 1000
+
+        while len(batch) < self.max_batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run_group(self, items: List, temperature: float, max_new_tokens: int, stop: Tuple[str, ...]):
+        requests = [request for request, _, _, _ in items]
+        answer_types = [answer_type for _, answer_type, _, _ in items]
+        traces = [trace for _, _, trace, _ in items if trace is not None]
+        token = trace_id.set(','.join(dict.fromkeys(traces)) or None)
+
+        try:
+            results = await self.run_exclusive(partial(self.former.generate_many, requests, logging=self.logging,
+                                                       temperature=temperature, max_new_tokens=max_new_tokens,
+                                                       stop=stop, answer_types=answer_types))
+        except Exception as e:
+            for _, _, _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            trace_id.reset(token)
+
+        for (_, _, _, future), result in zip(items, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import threading
+
+from typing import Dict, List, Optional, Tuple, Union
+
+from configs.configs import JOB_JOURNAL_DIR
+
+
+class JobJournal:
+    def __init__(self, job_id: str, journal_dir: str = JOB_JOURNAL_DIR):
+        self.job_id = job_id
+        self.journal_dir = journal_dir
+
+        self.spec: Optional[Dict] = None
+        self.answers: Dict[Tuple[int, str], Optional[str]] = {}
+        self.status = 'created'
+        self.failed_cells = 0
+        self.started: float = None
+
+        self._file = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.journal_dir, self.job_id)
+
+    @property
+    def spec_path(self) -> str:
+        return os.path.join(self.path, 'job.json')
+
+    @property
+    def answers_path(self) -> str:
+        return os.path.join(self.path, 'answers.jsonl')
+
+    @property
+    def image_files(self) -> List[str]:
+        return self.spec['image_files']
+
+    @property
+    def columns(self) -> Optional[List[str]]:
+        return self.spec['columns'] if self.spec is not None else None
+
+    @property
+    def column_types(self) -> Dict[str, Union[str, List[str]]]:
+        return self.spec.get('column_types') or {}
+
+    def exists(self) -> bool:
+        return os.path.exists(self.spec_path)
+
+    def load(self) -> bool:
+        if not self.exists():
+            return False
+
+        with open(self.spec_path) as file:
+            self.spec = json.load(file)
+
+        self.answers = {}
+        if os.path.exists(self.answers_path):
+            with open(self.answers_path) as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.answers[(entry['index'], entry['column'])] = entry['answer']
+
+        self.status = self.spec.get('status', 'created')
+        return True
+
+    def create(self, image_files: List[str], columns: List[str],
+               column_types: Dict[str, Union[str, List[str]]] = None):
+        self.spec = {"job_id": self.job_id, "image_files": list(image_files), "columns": list(columns),
+                     "column_types": column_types or {}, "created": time.time(), "status": 'created'}
+        os.makedirs(self.path, exist_ok=True)
+        self._save_spec()
+
+    def start(self):
+        self.started = time.time()
+        self.failed_cells = 0
+        self._set_status('running')
+
+    def finish(self):
+        self.close()
+        self._set_status('completed' if self.completed_cells == self.total_cells else 'incomplete')
+
+    def fail(self):
+        self.close()
+        if self.spec is not None:
+            self._set_status('failed')
+
+    def missing(self, index: int) -> List[str]:
+        return [column for column in self.columns if (index, column) not in self.answers]
+
+    def record(self, index: int, image_file: str, answers: Dict[str, Optional[str]]):
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.answers_path, 'a')
+
+            for column, answer in answers.items():
+                self._file.write(json.dumps({"index": index, "image_file": image_file, "column": column,
+                                             "answer": answer}) + '\n')
+                self.answers[(index, column)] = answer
+            self._file.flush()
+
+    def record_failure(self, cells: int):
+        with self._lock:
+            self.failed_cells += cells
+
+    def row(self, index: int) -> Dict:
+        return {"index": index, "image_file": self.image_files[index],
+                **{column: self.answers.get((index, column)) for column in self.columns}}
+
+    @property
+    def total_cells(self) -> int:
+        return len(self.image_files) * len(self.columns) if self.spec is not None else 0
+
+    @property
+    def completed_cells(self) -> int:
+        return len(self.answers)
+
+    @property
+    def progress(self) -> Dict:
+        return {"job_id": self.job_id, "status": self.status, "total_cells": self.total_cells,
+                "completed_cells": self.completed_cells, "failed_cells": self.failed_cells,
+                "progress": self.completed_cells / self.total_cells if self.total_cells else 0.0,
+                "elapsed_seconds": time.time() - self.started if self.started is not None else None}
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _set_status(self, status: str):
+        self.status = status
+        self.spec['status'] = status
+        self._save_spec()
+
+    def _save_spec(self):
+        tmp_path = self.spec_path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(self.spec, file)
+        os.replace(tmp_path, self.spec_path)
@@ -0,0 +1,48 @@
+import threading
+import time
+
+from typing import Any, Callable
+
+
+class LazyLoader:
+    def __init__(self, factory: Callable[[], Any], on_load: Callable[[Any], None] = None):
+        self.factory = factory
+        self.on_load = on_load
+
+        self.value = None
+        self.error: Exception = None
+        self.load_seconds: float = None
+
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def start(self):
+        threading.Thread(target=self._load_in_background, daemon=True).start()
+
+    def get(self):
+        if self._ready.is_set():
+            return self.value
+
+        with self._lock:
+            if not self._ready.is_set():
+                start = time.perf_counter()
+                value = self.factory()
+                if self.on_load is not None:
+                    self.on_load(value)
+
+                self.value = value
+                self.load_seconds = time.perf_counter() - start
+                self._ready.set()
+
+        return self.value
+
+    def _load_in_background(self):
+        try:
+            self.get()
+        except Exception as e:
+            self.error = e
+            print("Background loading failed:", repr(e))
@@ -0,0 +1,91 @@
+import time
+import uuid
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+from configs.configs import TRACE_HEADER, TRACE_LOGGING
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+STAGE_SECONDS = Histogram('sberai_stage_seconds', 'Time spent in a pipeline stage.', ['stage'],
+                          buckets=LATENCY_BUCKETS)
+STAGE_ERRORS = Counter('sberai_stage_errors_total', 'Pipeline stages that raised.', ['stage'])
+STAGE_ITEMS = Counter('sberai_stage_items_total', 'Items processed by a pipeline stage.', ['stage'])
+
+GENERATED_TOKENS = Counter('sberai_generation_tokens_total', 'Prompt and output tokens of generation.', ['kind'])
+GENERATION_TOKENS_PER_SECOND = Histogram('sberai_generation_tokens_per_second', 'Output tokens per second.',
+                                         buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500))
+GPU_MEMORY_PEAK_BYTES = Gauge('sberai_gpu_memory_peak_bytes', 'High-water mark of allocated GPU memory.')
+
+DISPATCH_SECONDS = Histogram('sberai_dispatch_seconds', 'Dispatcher request latency including retries.',
+                             ['endpoint'], buckets=LATENCY_BUCKETS)
+DISPATCH_REQUESTS = Counter('sberai_dispatch_requests_total', 'Dispatcher attempts by outcome.',
+                            ['endpoint', 'outcome'])
+HTTP_SECONDS = Histogram('sberai_http_seconds', 'Server-side HTTP request latency.', ['path', 'status'],
+                         buckets=LATENCY_BUCKETS)
+
+trace_id: ContextVar[Optional[str]] = ContextVar('trace_id', default=None)
+
+
+def new_trace_id() -> str:
+    trace = uuid.uuid4().hex
+    trace_id.set(trace)
+    return trace
+
+
+def trace_headers() -> Dict[str, str]:
+    trace = trace_id.get()
+    return {TRACE_HEADER: trace} if trace is not None else {}
+
+
+@contextmanager
+def timed(stage: str, items: int = 1):
+    start = time.perf_counter()
+
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.labels(stage).inc()
+        raise
+    finally:
+        observe(stage, time.perf_counter() - start, items)
+
+
+def observe(stage: str, seconds: float, items: int = 1):
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    STAGE_ITEMS.labels(stage).inc(items)
+
+    if TRACE_LOGGING and trace_id.get() is not None:
+        print(f"trace={trace_id.get()} stage={stage} items={items} seconds={seconds:.4f}")
+
+
+def record_generation(prompt_tokens: int, output_tokens: int, seconds: float):
+    GENERATED_TOKENS.labels('prompt').inc(prompt_tokens)
+    GENERATED_TOKENS.labels('output').inc(output_tokens)
+    if seconds > 0:
+        GENERATION_TOKENS_PER_SECOND.observe(output_tokens / seconds)
+
+
+async def trace_middleware(request, call_next):
+    trace = request.headers.get(TRACE_HEADER) or uuid.uuid4().hex
+    token = trace_id.set(trace)
+    start = time.perf_counter()
+
+    try:
+        response = await call_next(request)
+    finally:
+        trace_id.reset(token)
+
+    HTTP_SECONDS.labels(request.url.path, str(response.status_code)).observe(time.perf_counter() - start)
+    response.headers[TRACE_HEADER] = trace
+    return response
+
+
+def metrics_response():
+    from fastapi import Response
+
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,159 @@
+import os
+import json
+
+import faiss
+import numpy as np
+
+from typing import Dict, List, Optional
+
+from langchain.docstore.in_memory import InMemoryDocstore
+from langchain.vectorstores import FAISS
+
+from configs.configs import (
+    QUESTION_INDEX_DIR,
+    QUESTION_INDEX_TYPE,
+    QUESTION_INDEX_NLIST,
+    QUESTION_INDEX_HNSW_M
+)
+from model.metrics import timed
+
+
+class QuestionIndex:
+    INDEX_TYPES = ('flat', 'ivf', 'hnsw')
+
+    def __init__(
+            self,
+            embeddings,
+            dataset_id: str = None,
+            index_type: str = QUESTION_INDEX_TYPE,
+            index_dir: str = QUESTION_INDEX_DIR,
+            nlist: int = QUESTION_INDEX_NLIST,
+            hnsw_m: int = QUESTION_INDEX_HNSW_M
+    ):
+        if index_type not in self.INDEX_TYPES:
+            raise ValueError(f"Unknown index type {index_type}, expected one of {self.INDEX_TYPES}.")
+
+        self.embeddings = embeddings
+        self.dataset_id = dataset_id
+        self.index_type = index_type
+        self.index_dir = index_dir
+        self.nlist = nlist
+        self.hnsw_m = hnsw_m
+
+        self.store: FAISS = None
+        self.questions: List[str] = []
+        self.metadata = {}
+
+    @property
+    def path(self) -> Optional[str]:
+        return os.path.join(self.index_dir, self.dataset_id) if self.dataset_id is not None else None
+
+    @property
+    def memory_bytes(self) -> int:
+        if self.store is None:
+            return 0
+
+        index = self.store.index
+        size = index.ntotal * index.d * 4 + sum(len(question.encode('utf-8')) for question in self.questions)
+        if self.index_type == 'hnsw':
+            size += index.ntotal * self.hnsw_m * 2 * 4
+        return size
+
+    def exists(self) -> bool:
+        return self.path is not None and os.path.exists(os.path.join(self.path, 'index.faiss'))
+
+    def load(self) -> bool:
+        if not self.exists():
+            return False
+
+        self.store = FAISS.load_local(self.path, self.embeddings)
+        self.questions = [self.store.docstore.search(doc_id).page_content
+                          for doc_id in self.store.index_to_docstore_id.values()]
+
+        metadata_path = os.path.join(self.path, 'metadata.json')
+        if os.path.exists(metadata_path):
+            with open(metadata_path) as file:
+                self.metadata = json.load(file)
+
+        return True
+
+    def save(self):
+        if self.path is None or self.store is None:
+            return
+
+        self.store.save_local(self.path)
+        with open(os.path.join(self.path, 'metadata.json'), 'w') as file:
+            json.dump(self.metadata, file)
+
+    def add(self, questions: List[str]) -> int:
+        known = set(self.questions)
+        new_questions = [question for question in dict.fromkeys(questions) if question not in known]
+        if not new_questions:
+            return 0
+
+        vectors = self._embed(new_questions)
+        if self.store is None:
+            self.store = FAISS(self.embeddings, self._create_index(vectors), InMemoryDocstore({}), {})
+
+        self.store.add_embeddings(list(zip(new_questions, vectors.tolist())),
+                                  metadatas=[{'counts': 0} for _ in new_questions])
+        self.questions += new_questions
+
+        return len(new_questions)
+
+    def nearest(self, questions: List[str]) -> List[Optional[str]]:
+        if self.store is None or not questions:
+            return [None] * len(questions)
+
+        vectors = self._embed(questions)
+        with timed('faiss_search', items=len(questions)):
+            _, indices = self.store.index.search(vectors, 1)
+
+        return [self.questions[i] if i != -1 else None for i in indices[:, 0]]
+
+    def cluster(self, threshold: float, neighbours: int = 32) -> Dict[str, str]:
+        if not self.questions:
+            return {}
+
+        vectors = self._embed(self.questions)
+        faiss.normalize_L2(vectors)
+
+        with timed('faiss_search', items=len(self.questions)):
+            index = faiss.IndexFlatIP(vectors.shape[1])
+            index.add(vectors)
+            similarities, indices = index.search(vectors, min(neighbours, len(self.questions)))
+
+        parents = list(range(len(self.questions)))
+
+        def find(i: int) -> int:
+            while parents[i] != i:
+                parents[i] = parents[parents[i]]
+                i = parents[i]
+            return i
+
+        for i, (row_similarities, row_indices) in enumerate(zip(similarities, indices)):
+            for similarity, j in zip(row_similarities, row_indices):
+                if j != -1 and j != i and similarity >= threshold:
+                    root_i, root_j = find(i), find(j)
+                    parents[max(root_i, root_j)] = min(root_i, root_j)
+
+        return {question: self.questions[find(i)] for i, question in enumerate(self.questions)}
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        with timed('embed', items=len(texts)):
+            return np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+
+    def _create_index(self, vectors: np.ndarray):
+        dimension = vectors.shape[1]
+
+        if self.index_type == 'hnsw':
+            return faiss.IndexHNSWFlat(dimension, self.hnsw_m)
+
+        if self.index_type == 'ivf':
+            index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dimension), dimension, min(self.nlist, len(vectors)))
+            index.train(vectors)
+            index.make_direct_map()
+            index.nprobe = max(1, index.nlist // 10)
+            return index
+
+        return faiss.IndexFlatL2(dimension)
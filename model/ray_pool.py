@@ -0,0 +1,338 @@
+import json
+import time
+import uuid
+import asyncio
+
+import ray
+
+from typing import Any, Callable, Dict, List, Optional
+
+from ray.exceptions import RayActorError, RayTaskError
+
+from configs.configs import (
+    MODEL_NAME,
+    RAY_ADDRESS,
+    RAY_NAMESPACE,
+    RAY_RUNTIME_ENV,
+    RAY_POOL_NAME,
+    RAY_MIN_REPLICAS,
+    RAY_MAX_REPLICAS,
+    RAY_TARGET_ONGOING_REQUESTS,
+    RAY_DOWNSCALE_SECONDS,
+    RAY_ACTOR_OPTIONS,
+    RAY_MAX_RESTARTS,
+    RAY_MAX_TASK_RETRIES,
+    RAY_MAX_RETRIES,
+    RAY_SHIP_IMAGE_BYTES
+)
+from configs.configs_app import (
+    MODEL_LOGGING,
+    MODEL_DEVICE,
+    CPU_QUANTIZATION,
+    CPU_INTRA_OP_THREADS,
+    CPU_INTER_OP_THREADS,
+    CPU_CORE_PINNING,
+    CPU_WORKER_INDEX,
+    GENERATION_PROFILES,
+    IMAGE_CACHE_MAX_BYTES,
+    PREFIX_CACHING,
+    PREFIX_CACHE_MAX_BYTES,
+    SCHEDULER_MAX_BATCH_SIZE,
+    SCHEDULER_MAX_WAIT_MS
+)
+from model import metrics
+from model.structured_extraction import extraction_max_new_tokens, extraction_prompt, parse_extraction
+
+
+def create_former():
+    from model.table_former import TableFormer
+
+    return TableFormer(MODEL_NAME, device=MODEL_DEVICE, image_cache_bytes=IMAGE_CACHE_MAX_BYTES,
+                       prefix_caching=PREFIX_CACHING, prefix_cache_bytes=PREFIX_CACHE_MAX_BYTES,
+                       cpu_quantization=CPU_QUANTIZATION, num_threads=CPU_INTRA_OP_THREADS,
+                       inter_op_threads=CPU_INTER_OP_THREADS, core_pinning=CPU_CORE_PINNING,
+                       worker_index=CPU_WORKER_INDEX)
+
+
+@ray.remote
+class TableFormerActor:
+    def __init__(self, factory: Callable[[], Any] = create_former):
+        from model.inference_scheduler import InferenceScheduler
+
+        self.former = factory()
+        self.scheduler = InferenceScheduler(self.former, max_batch_size=SCHEDULER_MAX_BATCH_SIZE,
+                                            max_wait_ms=SCHEDULER_MAX_WAIT_MS, logging=MODEL_LOGGING)
+
+    def ready(self) -> bool:
+        return True
+
+    async def create_questions(self, image_file, trace: str = None) -> Dict:
+        self._prepare(trace)
+        result = await self.scheduler.submit(image_file=image_file, input=self.former.QUESTIONS_PROMPT,
+                                             **GENERATION_PROFILES['questions'])
+        return {"questions": result}
+
+    async def create_captioning(self, image_file, trace: str = None) -> Dict:
+        self._prepare(trace)
+        result = await self.scheduler.submit(image_file=image_file, input=self.former.CAPTION_PROMPT,
+                                             **GENERATION_PROFILES['caption'])
+        return {"answer": result}
+
+    async def create_vqa(self, image_file, question: str, refresh: bool = False, trace: str = None) -> Dict:
+        self._prepare(trace)
+        result = await self.scheduler.submit(image_file=image_file, input=question, refresh=refresh,
+                                             **GENERATION_PROFILES['short_answer'])
+        return {"question": question, "answer": result}
+
+    async def create_vqa_batch(self, image_file, questions: List[str], refresh: bool = False,
+                               answer_types: Dict = None, trace: str = None) -> Dict:
+        self._prepare(trace)
+        result = await self.scheduler.submit_many(image_file=image_file, inputs=questions, refresh=refresh,
+                                                  answer_types=answer_types, **GENERATION_PROFILES['short_answer'])
+        return {"answers": result}
+
+    async def create_table_row(self, image_file, columns: List[str], refresh: bool = False,
+                               column_types: Dict = None, trace: str = None) -> Dict:
+        self._prepare(trace)
+        result = await self.scheduler.submit(image_file=image_file, input=extraction_prompt(columns, column_types),
+                                             refresh=refresh, max_new_tokens=extraction_max_new_tokens(columns),
+                                             **GENERATION_PROFILES['table_row'])
+        return {"answer": result, "fields": parse_extraction(result['outputs'], columns, column_types)}
+
+    def _prepare(self, trace: Optional[str]):
+        self.scheduler.start()
+        metrics.trace_id.set(trace)
+
+
+class Replica:
+    def __init__(self, name: str, index: int, handle):
+        self.name = name
+        self.index = index
+        self.handle = handle
+        self.outstanding = 0
+        self.last_used = time.monotonic()
+
+
+class RayActorPool:
+    def __init__(
+            self,
+            factory: Callable[[], Any] = create_former,
+            name: str = RAY_POOL_NAME,
+            min_replicas: int = RAY_MIN_REPLICAS,
+            max_replicas: int = RAY_MAX_REPLICAS,
+            target_ongoing_requests: int = RAY_TARGET_ONGOING_REQUESTS,
+            downscale_seconds: float = RAY_DOWNSCALE_SECONDS,
+            actor_options: Dict = None,
+            max_restarts: int = RAY_MAX_RESTARTS,
+            max_task_retries: int = RAY_MAX_TASK_RETRIES
+    ):
+        if not ray.is_initialized():
+            ray.init(address=RAY_ADDRESS, namespace=RAY_NAMESPACE, runtime_env=RAY_RUNTIME_ENV)
+
+        self.factory = factory
+        self.name = f'{name}-{uuid.uuid4().hex[:8]}'
+        self.min_replicas = max(min_replicas, 1)
+        self.max_replicas = max(max_replicas, self.min_replicas)
+        self.target_ongoing_requests = target_ongoing_requests
+        self.downscale_seconds = downscale_seconds
+        self.actor_options = dict(actor_options if actor_options is not None else RAY_ACTOR_OPTIONS)
+        self.max_restarts = max_restarts
+        self.max_task_retries = max_task_retries
+
+        if not ray.cluster_resources().get('GPU'):
+            self.actor_options.pop('num_gpus', None)
+
+        self.replicas: List[Replica] = []
+        self.replaced = 0
+        self.created = 0
+
+        self.start()
+
+    def start(self):
+        while len(self.replicas) < self.min_replicas:
+            self._add_replica()
+
+    async def call(self, method: str, *args, **kwargs):
+        replica = self._acquire()
+
+        try:
+            return await getattr(replica.handle, method).remote(*args, **kwargs)
+        except RayActorError:
+            self._replace(replica)
+            raise
+        finally:
+            self._release(replica)
+
+    def wait_ready(self, timeout: float = None):
+        ray.get([replica.handle.ready.remote() for replica in self.replicas], timeout=timeout)
+
+    def shutdown(self):
+        for replica in self.replicas:
+            ray.kill(replica.handle)
+        self.replicas = []
+
+    @property
+    def stats(self) -> List[Dict]:
+        return [{"name": replica.name, "outstanding": replica.outstanding} for replica in self.replicas]
+
+    def _add_replica(self) -> Replica:
+        indexes = {replica.index for replica in self.replicas}
+        index = next(i for i in range(len(indexes) + 1) if i not in indexes)
+        name = f'{self.name}-{self.created}'
+        self.created += 1
+
+        options = dict(self.actor_options)
+        runtime_env = dict(options.pop('runtime_env', None) or {})
+        runtime_env['env_vars'] = {**runtime_env.get('env_vars', {}), 'TABLE_FORMER_WORKER_INDEX': str(index)}
+
+        handle = TableFormerActor.options(name=name, max_restarts=self.max_restarts,
+                                          max_task_retries=self.max_task_retries,
+                                          max_concurrency=max(self.target_ongoing_requests * 4, 64),
+                                          runtime_env=runtime_env, **options).remote(self.factory)
+        replica = Replica(name, index, handle)
+        self.replicas.append(replica)
+        return replica
+
+    def _acquire(self) -> Replica:
+        replica = min(self.replicas, key=lambda candidate: candidate.outstanding)
+        if replica.outstanding >= self.target_ongoing_requests and len(self.replicas) < self.max_replicas:
+            print("Scaling up Ray pool:", len(self.replicas) + 1)
+            replica = self._add_replica()
+
+        replica.outstanding += 1
+        return replica
+
+    def _release(self, replica: Replica):
+        now = time.monotonic()
+        replica.outstanding -= 1
+        replica.last_used = now
+
+        ongoing = sum(candidate.outstanding for candidate in self.replicas)
+        idle = [candidate for candidate in self.replicas
+                if candidate.outstanding == 0 and now - candidate.last_used > self.downscale_seconds]
+
+        while idle and len(self.replicas) > self.min_replicas and \
+                ongoing <= self.target_ongoing_requests * (len(self.replicas) - 1):
+            candidate = idle.pop()
+            print("Scaling down Ray pool:", len(self.replicas) - 1)
+            self.replicas.remove(candidate)
+            ray.kill(candidate.handle)
+
+    def _replace(self, replica: Replica):
+        if replica not in self.replicas:
+            return
+
+        print("Replacing Ray replica:", replica.name)
+        self.replicas.remove(replica)
+        ray.kill(replica.handle, no_restart=True)
+        self.replaced += 1
+        if len(self.replicas) < self.min_replicas:
+            self._add_replica()
+
+
+@ray.remote(num_cpus=0)
+class RayPoolManager:
+    def __init__(self, factory: Callable[[], Any] = create_former, **options):
+        self.pool = RayActorPool(factory, **options)
+        self.clients = 0
+
+    def attach(self) -> int:
+        self.pool.start()
+        self.clients += 1
+        return self.clients
+
+    def detach(self) -> int:
+        self.clients = max(self.clients - 1, 0)
+        if not self.clients:
+            print("Last client detached, shutting down Ray pool:", self.pool.name)
+            self.pool.shutdown()
+        return self.clients
+
+    async def call(self, method: str, args: tuple, kwargs: Dict):
+        return await self.pool.call(method, *args, **kwargs)
+
+    def stats(self) -> List[Dict]:
+        return self.pool.stats
+
+
+class SharedRayPool:
+    def __init__(self, factory: Callable[[], Any] = create_former, name: str = RAY_POOL_NAME, **options):
+        if not ray.is_initialized():
+            ray.init(address=RAY_ADDRESS, namespace=RAY_NAMESPACE, runtime_env=RAY_RUNTIME_ENV)
+
+        self.manager = RayPoolManager.options(name=f'{name}-manager', lifetime='detached',
+                                              get_if_exists=True).remote(factory, name=name, **options)
+        ray.get(self.manager.attach.remote())
+        self.closed = False
+
+    async def call(self, method: str, *args, **kwargs):
+        return await self.manager.call.remote(method, args, kwargs)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            ray.get(self.manager.detach.remote())
+
+    @property
+    def stats(self) -> List[Dict]:
+        return ray.get(self.manager.stats.remote())
+
+
+class RayDispatcher:
+    def __init__(self, pool=None, max_retries: int = RAY_MAX_RETRIES,
+                 ship_image_bytes: bool = RAY_SHIP_IMAGE_BYTES):
+        self.pool = pool if pool is not None else SharedRayPool()
+        self.max_retries = max_retries
+        self.ship_image_bytes = ship_image_bytes
+
+        self.failures: List[Dict] = []
+
+    async def post(self, session, endpoint: str, payload) -> Optional[Dict]:
+        with metrics.DISPATCH_SECONDS.labels(endpoint).time():
+            kwargs = await self._arguments(endpoint, payload)
+
+            for attempt in range(self.max_retries + 1):
+                try:
+                    data = await self.pool.call(endpoint, trace=metrics.trace_id.get(), **kwargs)
+                    metrics.DISPATCH_REQUESTS.labels(endpoint, 'ok').inc()
+                    return data
+                except (RayTaskError, RayActorError) as e:
+                    metrics.DISPATCH_REQUESTS.labels(endpoint, type(e).__name__).inc()
+                    if not isinstance(e, RayActorError) and not isinstance(getattr(e, 'cause', None), RayActorError):
+                        print("Ray request failed:", repr(e))
+                        break
+                    print("Ray replica failed:", repr(e))
+
+        self.failures.append({"endpoint": endpoint, "payload": payload})
+        return None
+
+    @property
+    def stats(self) -> List[Dict]:
+        return self.pool.stats
+
+    def close(self):
+        if isinstance(self.pool, SharedRayPool):
+            self.pool.close()
+        else:
+            self.pool.shutdown()
+
+    async def _arguments(self, endpoint: str, payload: Dict) -> Dict:
+        kwargs = dict(payload)
+
+        if self.ship_image_bytes and isinstance(kwargs.get('image_file'), str):
+            kwargs['image_file'] = ray.put(await asyncio.to_thread(self._read, kwargs['image_file']))
+        if endpoint == 'create_vqa_batch':
+            kwargs['questions'] = json.loads(kwargs['questions'])
+            kwargs['answer_types'] = json.loads(kwargs['answer_types']) if kwargs.get('answer_types') else None
+        if endpoint == 'create_table_row':
+            kwargs['columns'] = json.loads(kwargs['columns'])
+            kwargs['column_types'] = json.loads(kwargs['column_types']) if kwargs.get('column_types') else None
+        if 'refresh' in kwargs:
+            kwargs['refresh'] = str(kwargs['refresh']).lower() in ('1', 'true')
+
+        return kwargs
+
+    @staticmethod
+    def _read(path: str) -> bytes:
+        with open(path, 'rb') as file:
+            return file.read()
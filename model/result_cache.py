@@ -0,0 +1,125 @@
+import os
+import re
+import json
+import queue
+import sqlite3
+import hashlib
+import threading
+
+from collections import OrderedDict
+from typing import Dict, Optional, Union
+
+from model.image_cache import SharedImage
+
+
+class ResultCache:
+    def __init__(self, path: str, model_name: str, memory_entries: int = 10000):
+        self.path = path
+        self.model_name = model_name
+        self.memory_entries = memory_entries
+
+        self.hits = 0
+        self.misses = 0
+
+        self._memory: OrderedDict = OrderedDict()
+        self._digests: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        self._connection.commit()
+
+        self._writes = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def make_key(self, source: Union[str, bytes, SharedImage], question: str,
+                 temperature: float, max_new_tokens: int, options: Dict = None) -> str:
+        key = json.dumps([self.image_digest(source), self.normalize(question), float(temperature),
+                          int(max_new_tokens), self.model_name, options], sort_keys=True)
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+
+        with self._db_lock:
+            row = self._connection.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            value = json.loads(row[0])
+            self._remember(self._memory, key, value)
+            return value
+
+    def put(self, key: str, value: Dict):
+        with self._lock:
+            self._remember(self._memory, key, value)
+        self._writes.put((key, json.dumps(value)))
+
+    def image_digest(self, source: Union[str, bytes, SharedImage]) -> str:
+        if isinstance(source, SharedImage):
+            return source.digest()
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return hashlib.sha1(source).hexdigest()
+
+        stat = os.stat(source)
+        stat_key = (os.path.abspath(source), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if stat_key in self._digests:
+                return self._digests[stat_key]
+
+        digest = hashlib.sha1()
+        with open(source, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                digest.update(chunk)
+
+        with self._lock:
+            self._remember(self._digests, stat_key, digest.hexdigest())
+        return digest.hexdigest()
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        return re.sub(r'\s+', ' ', question).strip().lower()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "memory_entries": len(self._memory)}
+
+    def close(self):
+        self._writes.put(None)
+        self._writer.join()
+        with self._db_lock:
+            self._connection.close()
+
+    def _remember(self, entries: OrderedDict, key, value):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.memory_entries:
+            entries.popitem(last=False)
+
+    def _write_loop(self):
+        while True:
+            rows = [self._writes.get()]
+            while not self._writes.empty():
+                rows.append(self._writes.get_nowait())
+
+            closing = None in rows
+            rows = [row for row in rows if row is not None]
+            if rows:
+                with self._db_lock:
+                    self._connection.executemany('INSERT OR REPLACE INTO results (key, value) VALUES (?, ?)', rows)
+                    self._connection.commit()
+
+            if closing:
+                return
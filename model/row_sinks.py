@@ -0,0 +1,93 @@
+import csv
+import os
+
+from abc import ABC, abstractmethod
+from typing import Dict, List
+
+
+class RowSink(ABC):
+    def __init__(self, path: str, row_group_size: int = 1000):
+        self.path = path
+        self.row_group_size = row_group_size
+        self.columns: List[str] = None
+        self._buffer: List[Dict] = []
+
+    def write(self, row: Dict):
+        if self.columns is None:
+            self.columns = list(row)
+
+        self._buffer.append(row)
+        if len(self._buffer) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._write_group(self._buffer)
+            self._buffer = []
+
+    def close(self):
+        self.flush()
+
+    @abstractmethod
+    def _write_group(self, rows: List[Dict]):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class CsvRowSink(RowSink):
+    def __init__(self, path: str, row_group_size: int = 100):
+        super().__init__(path, row_group_size)
+        self._file = None
+        self._writer: csv.DictWriter = None
+
+    def _write_group(self, rows: List[Dict]):
+        if self._writer is None:
+            append = os.path.exists(self.path) and os.path.getsize(self.path) > 0
+            if append:
+                with open(self.path, newline='') as file:
+                    self.columns = next(csv.reader(file))
+
+            self._file = open(self.path, 'a', newline='')
+            self._writer = csv.DictWriter(self._file, fieldnames=self.columns, extrasaction='ignore')
+            if not append:
+                self._writer.writeheader()
+
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def close(self):
+        super().close()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._writer = None
+
+
+class ParquetRowSink(RowSink):
+    def __init__(self, path: str, row_group_size: int = 1000):
+        super().__init__(path, row_group_size)
+        self._writer = None
+        self._schema = None
+
+    def _write_group(self, rows: List[Dict]):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self._writer is None:
+            self._schema = pa.schema([(column, pa.int64() if column == 'index' else pa.string())
+                                      for column in self.columns])
+            self._writer = pq.ParquetWriter(self.path, self._schema)
+
+        data = {column: [row.get(column) for row in rows] for column in self.columns}
+        self._writer.write_table(pa.Table.from_pydict(data, schema=self._schema))
+
+    def close(self):
+        super().close()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
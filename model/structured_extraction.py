@@ -0,0 +1,87 @@
+import re
+import json
+
+from typing import Dict, List, Optional, Union
+
+from configs.configs_app import TABLE_ROW_VALUE_TOKENS
+
+NUMBER_PATTERN = re.compile(r'[-+]?\d+(?:[.,]\d+)?')
+LINE_PATTERN = re.compile(r'^\s*(?:[-*•]|\d+[.)])?\s*"?(.+?)"?\s*[:=]\s*(.*?)\s*,?\s*$')
+
+
+def extraction_prompt(columns: List[str], column_types: Dict[str, Union[str, List[str]]] = None) -> str:
+    column_types = column_types or {}
+    fields = '\n'.join(f'{json.dumps(column, ensure_ascii=False)}: {_type_hint(column_types.get(column))}'
+                       for column in columns)
+
+    return ("Fill in one table row for this picture. Reply with a single JSON object that has exactly these keys, "
+            "and give every value as one number, word or phrase:\n" + fields)
+
+
+def extraction_max_new_tokens(columns: List[str], value_tokens: int = TABLE_ROW_VALUE_TOKENS) -> int:
+    return value_tokens + sum(len(column) // 3 + value_tokens for column in columns)
+
+
+def parse_extraction(output: str, columns: List[str],
+                     column_types: Dict[str, Union[str, List[str]]] = None) -> Dict[str, Optional[str]]:
+    column_types = column_types or {}
+    output = output.removesuffix('</s>')
+    fields = _parse_json(output)
+    if fields is None:
+        fields = _parse_lines(output)
+
+    fields = {_normalize(key): value for key, value in fields.items()}
+    return {column: _validate(fields.get(_normalize(column)), column_types.get(column)) for column in columns}
+
+
+def _type_hint(answer_type: Union[str, List[str], None]) -> str:
+    if answer_type == 'numeric':
+        return 'a number'
+    if isinstance(answer_type, list):
+        return 'one of ' + ', '.join(answer_type)
+    return 'a short answer'
+
+
+def _parse_json(output: str) -> Optional[Dict]:
+    start, end = output.find('{'), output.rfind('}')
+    if start == -1 or end <= start:
+        return None
+
+    try:
+        fields = json.loads(output[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+
+    return fields if isinstance(fields, dict) else None
+
+
+def _parse_lines(output: str) -> Dict[str, str]:
+    fields = {}
+    for line in output.splitlines():
+        match = LINE_PATTERN.match(line)
+        if match is not None:
+            fields[match.group(1)] = match.group(2).strip('"')
+    return fields
+
+
+def _normalize(key: str) -> str:
+    return re.sub(r'[^\w]+', ' ', str(key)).strip().lower()
+
+
+def _validate(value, answer_type: Union[str, List[str], None]) -> Optional[str]:
+    if value is None or isinstance(value, (dict, list)):
+        return None
+
+    if isinstance(value, bool):
+        value = 'yes' if value else 'no'
+
+    value = str(value).strip()
+    if not value:
+        return None
+
+    if answer_type == 'numeric':
+        return value if NUMBER_PATTERN.fullmatch(value) else None
+    if isinstance(answer_type, list):
+        choices = {choice.lower(): choice for choice in answer_type}
+        return choices.get(value.lower())
+    return value
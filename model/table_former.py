@@ -1,6 +1,12 @@
+import io
+import os
+import json
+import time
+import tempfile
+
 import torch
 
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple, Union
 
 from llava.constants import IMAGE_TOKEN_INDEX, DEFAULT_IMAGE_TOKEN, DEFAULT_IM_START_TOKEN, DEFAULT_IM_END_TOKEN
 from llava.conversation import conv_templates, SeparatorStyle
@@ -12,72 +18,122 @@ from PIL import Image
 
 from transformers import TextStreamer
 
+from model.image_cache import ImageCache, SharedImage
+from model.answer_constraints import create_constraint
+from model.structured_extraction import extraction_max_new_tokens, extraction_prompt, parse_extraction
+from model.cpu_backend import configure_threads, pin_cores, prepare_cpu_model, select_device
+from model.metrics import GPU_MEMORY_PEAK_BYTES, observe, record_generation, timed
+
 
 class TableFormer:
     NUM_THREADS = 3
+    CAPTION_PROMPT = "Please make a detailed caption of this picture."
+    QUESTIONS_PROMPT = 'Please create 5 questions which you can ask about this picture \
+                  separated by "\n" without enumeration.'
 
     def __init__(self,
                  model_path: str, model_base=None, load_8bit: bool = False,
-                 load_4bit: bool = True, device: str = 'cuda', conv=conv_templates["llava_v0"]
+                 load_4bit: bool = True, device: str = 'auto', conv=conv_templates["llava_v0"],
+                 image_cache_bytes: int = 2 * 1024 ** 3, prefix_caching: bool = False,
+                 prefix_cache_bytes: int = 2 * 1024 ** 3, cpu_quantization: Optional[str] = 'int8',
+                 num_threads: int = None, inter_op_threads: int = 1, core_pinning: bool = False,
+                 worker_index: int = 0
                  ):
+        self.device = select_device(device)
         self.model_name = get_model_name_from_path(model_path)
-        self.tokenizer, self.model, self.image_processor, self.context_len = load_pretrained_model(
-            model_path, model_base, self.model_name, load_8bit, load_4bit, device=device)
+
+        if self.device == 'cpu':
+            num_threads = num_threads or self.NUM_THREADS
+            if core_pinning:
+                print("Pinned TableFormer worker to cores:", pin_cores(worker_index, num_threads))
+            configure_threads(num_threads, inter_op_threads)
+
+            self.tokenizer, self.model, self.image_processor, self.context_len = load_pretrained_model(
+                model_path, model_base, self.model_name, False, False, device_map={'': 'cpu'}, device='cpu')
+            self.model = prepare_cpu_model(self.model, cpu_quantization)
+            self.dtype = torch.bfloat16 if cpu_quantization == 'bf16' else torch.float32
+        else:
+            self.tokenizer, self.model, self.image_processor, self.context_len = load_pretrained_model(
+                model_path, model_base, self.model_name, load_8bit, load_4bit, device=self.device)
+            self.dtype = torch.float16
+
         self.conv = conv
 
         self.questions = []
 
-        self.image_file = None
-        self.image_tuple = None
+        self.prefix_caching = prefix_caching
+        self.prefix_cache = ImageCache(prefix_cache_bytes)
+        self.image_cache = ImageCache(image_cache_bytes, on_evict=self.prefix_cache.evict)
+        self.constraints = {}
+
+    def image_tensor(self, source: Union[str, bytes, SharedImage]):
+        with timed('image_tensor'):
+            return self._load_image(source)
+
+    def _load_image(self, source: Union[str, bytes, SharedImage]):
+        if isinstance(source, SharedImage):
+            with source.buffer() as buffer:
+                return self._preprocess(Image.frombuffer('RGB', source.size, buffer, 'raw', 'RGB', 0, 1))
 
-    def image_tensor(self, image_file: str):
-        image = Image.open(image_file).convert('RGB')
+        image = Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+        if image.format == 'JPEG':
+            image.draft('RGB', (self.image_size, self.image_size))
+
+        return self._preprocess(image.convert('RGB'))
+
+    @property
+    def image_size(self) -> int:
+        crop_size = getattr(self.image_processor, 'crop_size', 336)
+        return min(crop_size['height'], crop_size['width']) if isinstance(crop_size, dict) else crop_size
+
+    def _preprocess(self, image: Image.Image):
         disable_torch_init()
 
         image_tensor = process_images([image], self.image_processor, self.model.config)
         if type(image_tensor) is list:
-            image_tensor = [image.to(self.model.device, dtype=torch.float16) for image in image_tensor]
+            image_tensor = [image.to(self.model.device, dtype=self.dtype) for image in image_tensor]
         else:
-            image_tensor = image_tensor.to(self.model.device, dtype=torch.float16)
+            image_tensor = image_tensor.to(self.model.device, dtype=self.dtype)
 
-        return image_tensor, image
+        return image_tensor, image.size
 
     def make_prompt(self, image, input):
-        self.conv.messages = []
-        input = f"{self.conv.roles[0]}: {input}"
+        conv = self.conv.copy()
+        conv.messages = []
+        input = f"{conv.roles[0]}: {input}"
 
         if image is not None:
             if self.model.config.mm_use_im_start_end:
                 input = DEFAULT_IM_START_TOKEN + DEFAULT_IMAGE_TOKEN + DEFAULT_IM_END_TOKEN + '\n' + input
             else:
                 input = DEFAULT_IMAGE_TOKEN + '\n' + input
-            self.conv.append_message(self.conv.roles[0], input)
+            conv.append_message(conv.roles[0], input)
             image = None
         else:
-            self.conv.append_message(self.conv.roles[0], input)
+            conv.append_message(conv.roles[0], input)
 
-        self.conv.append_message(self.conv.roles[1], None)
-        prompt = self.conv.get_prompt()
+        conv.append_message(conv.roles[1], None)
+        prompt = conv.get_prompt()
         return prompt
 
     async def predict(self,
                       image_file: str, input: str, logging: bool = False,
-                      temperature: float = 0.2, max_new_tokens: int = 512) -> Dict:
-        torch.cuda.empty_cache()
+                      temperature: float = 0.2, max_new_tokens: int = 512, stop: Tuple[str, ...] = ()) -> Dict:
+        if self.prefix_caching:
+            return self.generate_batch(image_file, [input], logging, temperature, max_new_tokens, stop)[input]
+
+        self._empty_cache()
 
-        image_tensor, image = self.image_tensor(image_file) if not self.image_file else self.image_tuple
-        self.image_file = image_file
-        self.image_tuple = (image_tensor, image)
+        _, (image_tensor, image) = self.image_cache.get_or_load(image_file, self.image_tensor)
         prompt = self.make_prompt(image, input)
 
-        input_ids = tokenizer_image_token(prompt, self.tokenizer, IMAGE_TOKEN_INDEX,
-                                          return_tensors='pt').unsqueeze(0).to(self.model.device)
-        stop_str = self.conv.sep if self.conv.sep_style != SeparatorStyle.TWO else self.conv.sep2
-        keywords = [stop_str]
+        input_ids = self._tokenize(prompt).unsqueeze(0)
+        keywords = self._stop_strings(stop)
         stopping_criteria = KeywordsStoppingCriteria(keywords, self.tokenizer, input_ids)
-        streamer = TextStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        streamer = TextStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True) if logging else None
 
-        with torch.inference_mode():
+        start = time.perf_counter()
+        with torch.inference_mode(), timed('generate'):
             output_ids = self.model.generate(
                 input_ids,
                 images=image_tensor,
@@ -87,9 +143,11 @@ class TableFormer:
                 streamer=streamer,
                 use_cache=True,
                 stopping_criteria=[stopping_criteria])
+        record_generation(input_ids.shape[1], output_ids.shape[1] - input_ids.shape[1], time.perf_counter() - start)
+        self._record_gpu_memory()
 
-        outputs = self.tokenizer.decode(output_ids[0, input_ids.shape[1]:]).strip()
-        self.conv.messages[-1][-1] = outputs
+        outputs = self._strip_stop(self.tokenizer.decode(output_ids[0, input_ids.shape[1]:], skip_special_tokens=True),
+                                   keywords)
 
         prompt_outputs = {"prompt": prompt, "outputs": outputs}
 
@@ -98,13 +156,250 @@ class TableFormer:
 
         return prompt_outputs
 
+    async def predict_batch(self,
+                            image_file: str, questions: List[str], logging: bool = False,
+                            temperature: float = 0.2, max_new_tokens: int = 512, stop: Tuple[str, ...] = (),
+                            answer_types: Dict[str, Union[str, List[str]]] = None) -> Dict[str, Dict]:
+        return self.generate_batch(image_file, questions, logging, temperature, max_new_tokens, stop, answer_types)
+
+    def generate_batch(self,
+                       image_file: Union[str, bytes, SharedImage], inputs: List[str], logging: bool = False,
+                       temperature: float = 0.2, max_new_tokens: int = 512, stop: Tuple[str, ...] = (),
+                       answer_types: Dict[str, Union[str, List[str]]] = None) -> Dict[str, Dict]:
+        inputs = list(dict.fromkeys(inputs))
+        answer_types = [(answer_types or {}).get(input) for input in inputs]
+        results = self.generate_many([(image_file, input) for input in inputs], logging, temperature, max_new_tokens,
+                                     stop, answer_types)
+        return dict(zip(inputs, results))
+
+    def generate_many(self,
+                      requests: List[Tuple[Union[str, bytes, SharedImage], str]], logging: bool = False,
+                      temperature: float = 0.2, max_new_tokens: int = 512, stop: Tuple[str, ...] = (),
+                      answer_types: List[Union[str, List[str], None]] = None) -> List[Dict]:
+        self._empty_cache()
+
+        images = {}
+        for image_file, _ in requests:
+            if image_file not in images:
+                images[image_file] = self.image_cache.get_or_load(image_file, self.image_tensor)
+
+        prompts = [self.make_prompt(images[image_file][1][1], input) for image_file, input in requests]
+        input_ids = [self._tokenize(prompt) for prompt in prompts]
+        stop = self._stop_strings(stop)
+        constraints = [self._constraint(answer_type) for answer_type in answer_types or [None] * len(requests)]
+
+        with torch.inference_mode(), timed('generate', items=len(requests)):
+            if self.prefix_caching:
+                outputs = [None] * len(requests)
+                for image_file, (image_key, (image_tensor, _)) in images.items():
+                    indices = [i for i, (file, _) in enumerate(requests) if file == image_file]
+                    image_outputs = self._decode_with_prefix(image_key, image_tensor, [input_ids[i] for i in indices],
+                                                             temperature, max_new_tokens, stop,
+                                                             [constraints[i] for i in indices])
+                    for i, output in zip(indices, image_outputs):
+                        outputs[i] = output
+            else:
+                image_features = self.model.encode_images(
+                    torch.cat([image_tensor for _, (image_tensor, _) in images.values()]))
+                image_features = dict(zip(images, image_features))
+                embeds = [self._embed_prompt(ids, image_features[image_file])
+                          for ids, (image_file, _) in zip(input_ids, requests)]
+                inputs_embeds, attention_mask = self._left_pad(embeds)
+                outputs = self._decode(inputs_embeds, attention_mask, temperature, max_new_tokens, stop,
+                                       constraints=constraints)
+        self._record_gpu_memory()
+
+        results = []
+        for prompt, output in zip(prompts, outputs):
+            results.append({"prompt": prompt, "outputs": output})
+
+            if logging:
+                print("\n", results[-1], "\n")
+
+        return results
+
+    def _stop_strings(self, stop: Tuple[str, ...] = ()) -> List[str]:
+        stop_str = self.conv.sep if self.conv.sep_style != SeparatorStyle.TWO else self.conv.sep2
+        return [stop_str, *stop]
+
+    def _constraint(self, answer_type: Union[str, List[str], None]):
+        if answer_type is None:
+            return None
+
+        key = json.dumps(answer_type)
+        if key not in self.constraints:
+            self.constraints[key] = create_constraint(self.tokenizer, answer_type)
+        return self.constraints[key]
+
+    def _tokenize(self, prompt: str) -> torch.Tensor:
+        with timed('tokenize'):
+            return tokenizer_image_token(prompt, self.tokenizer, IMAGE_TOKEN_INDEX,
+                                         return_tensors='pt').to(self.model.device)
+
+    def _empty_cache(self):
+        if self.device == 'cuda':
+            torch.cuda.empty_cache()
+
+    def _record_gpu_memory(self):
+        if self.device == 'cuda':
+            GPU_MEMORY_PEAK_BYTES.set(torch.cuda.max_memory_allocated())
+
+    def _decode_with_prefix(self, image_key, image_tensor, input_ids: List[torch.Tensor], temperature: float,
+                            max_new_tokens: int, stop: List[str], constraints: List = None) -> List[str]:
+        position = torch.where(input_ids[0] == IMAGE_TOKEN_INDEX)[0][0].item()
+        past_key_values, prefix_len = self._prefix_state(image_key, image_tensor, input_ids[0][:position + 1])
+
+        embed_tokens = self.model.get_model().embed_tokens
+        inputs_embeds, attention_mask = self._left_pad([embed_tokens(ids[position + 1:]) for ids in input_ids])
+        attention_mask = torch.cat([attention_mask.new_ones((len(input_ids), prefix_len)), attention_mask], dim=-1)
+        past_key_values = tuple(tuple(state.expand(len(input_ids), *state.shape[1:]) for state in layer)
+                                for layer in past_key_values)
+
+        return self._decode(inputs_embeds, attention_mask, temperature, max_new_tokens, stop,
+                            past_key_values=past_key_values, constraints=constraints)
+
+    def _prefix_state(self, image_key, image_tensor, prefix_ids: torch.Tensor) -> Tuple[tuple, int]:
+        prefix_tokens = tuple(prefix_ids.tolist())
+        cached = self.prefix_cache.get(image_key)
+
+        if cached is not None and cached[0] == prefix_tokens:
+            return cached[1], cached[2]
+
+        with timed('prefix_prefill'):
+            image_features = self.model.encode_images(image_tensor)[0]
+            inputs_embeds = self._embed_prompt(prefix_ids, image_features).unsqueeze(0)
+            hidden = self.model.get_model()(inputs_embeds=inputs_embeds, use_cache=True, return_dict=True)
+
+        self.prefix_cache.put(image_key, (prefix_tokens, hidden.past_key_values, inputs_embeds.shape[1]))
+        return hidden.past_key_values, inputs_embeds.shape[1]
+
+    def _embed_prompt(self, input_ids: torch.Tensor, image_features: torch.Tensor) -> torch.Tensor:
+        embed_tokens = self.model.get_model().embed_tokens
+        image_position = torch.where(input_ids == IMAGE_TOKEN_INDEX)[0]
+
+        if len(image_position) == 0:
+            return embed_tokens(input_ids)
+
+        position = image_position[0].item()
+        return torch.cat([embed_tokens(input_ids[:position]),
+                          image_features.to(embed_tokens.weight.dtype),
+                          embed_tokens(input_ids[position + 1:])], dim=0)
+
+    @staticmethod
+    def _left_pad(embeds: List[torch.Tensor]) -> Tuple[torch.Tensor, torch.Tensor]:
+        max_len = max(embed.shape[0] for embed in embeds)
+        inputs_embeds = embeds[0].new_zeros((len(embeds), max_len, embeds[0].shape[-1]))
+        attention_mask = torch.zeros((len(embeds), max_len), dtype=torch.long, device=embeds[0].device)
+
+        for i, embed in enumerate(embeds):
+            inputs_embeds[i, max_len - embed.shape[0]:] = embed
+            attention_mask[i, max_len - embed.shape[0]:] = 1
+
+        return inputs_embeds, attention_mask
+
+    def _decode(self, inputs_embeds: torch.Tensor, attention_mask: torch.Tensor, temperature: float,
+                max_new_tokens: int, stop: List[str], past_key_values=None,
+                constraints: List = None) -> List[str]:
+        backbone = self.model.get_model()
+        batch_size = inputs_embeds.shape[0]
+        generated = [[] for _ in range(batch_size)]
+        finished = [False] * batch_size
+        constraints = constraints or [None] * batch_size
+        prompt_tokens = int(attention_mask.sum())
+        start = step_start = time.perf_counter()
+        prefill_seconds = None
+
+        for _ in range(max_new_tokens):
+            position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)[:, -inputs_embeds.shape[1]:]
+            hidden = backbone(inputs_embeds=inputs_embeds, attention_mask=attention_mask, position_ids=position_ids,
+                              past_key_values=past_key_values, use_cache=True, return_dict=True)
+            past_key_values = hidden.past_key_values
+            logits = self.model.lm_head(hidden.last_hidden_state[:, -1, :]).float()
+
+            for i, constraint in enumerate(constraints):
+                if constraint is None or finished[i]:
+                    continue
+
+                allowed = constraint.allowed(generated[i])
+                if not allowed or allowed == [self.tokenizer.eos_token_id]:
+                    finished[i] = True
+                    continue
+
+                mask = torch.full_like(logits[i], float('-inf'))
+                mask[allowed] = 0
+                logits[i] += mask
+
+            if all(finished):
+                break
+
+            if temperature > 0:
+                next_tokens = torch.multinomial(torch.softmax(logits / temperature, dim=-1), num_samples=1)[:, 0]
+            else:
+                next_tokens = logits.argmax(dim=-1)
+
+            for i, token in enumerate(next_tokens.tolist()):
+                if finished[i]:
+                    continue
+                generated[i].append(token)
+                if token == self.tokenizer.eos_token_id or self._has_stop(self.tokenizer.decode(generated[i]), stop):
+                    finished[i] = True
+
+            if all(finished):
+                break
+
+            if prefill_seconds is None:
+                prefill_seconds = time.perf_counter() - step_start
+
+            inputs_embeds = backbone.embed_tokens(next_tokens).unsqueeze(1)
+            attention_mask = torch.cat([attention_mask, attention_mask.new_ones((batch_size, 1))], dim=-1)
+
+        seconds = time.perf_counter() - start
+        observe('prefill', prefill_seconds if prefill_seconds is not None else seconds, batch_size)
+        observe('decode', seconds - (prefill_seconds or seconds), batch_size)
+        record_generation(prompt_tokens, sum(len(tokens) for tokens in generated), seconds)
+
+        return [self._strip_stop(self.tokenizer.decode(tokens, skip_special_tokens=True), stop)
+                for tokens in generated]
+
+    @staticmethod
+    def _has_stop(outputs: str, stop: List[str]) -> bool:
+        outputs = outputs.lstrip()
+        return any(stop_str and stop_str in outputs for stop_str in stop)
+
+    @staticmethod
+    def _strip_stop(outputs: str, stop: List[str]) -> str:
+        outputs = outputs.lstrip()
+        for stop_str in stop:
+            if stop_str:
+                outputs = outputs.split(stop_str)[0]
+        return outputs.strip()
+
+    def warmup(self, max_new_tokens: int = 8) -> float:
+        handle, image_file = tempfile.mkstemp(suffix='.png')
+        os.close(handle)
+
+        try:
+            Image.new('RGB', (336, 336)).save(image_file)
+            start = time.perf_counter()
+            self.generate_many([(image_file, self.CAPTION_PROMPT)], max_new_tokens=max_new_tokens)
+            self.image_cache.evict(ImageCache.make_key(image_file))
+        finally:
+            os.remove(image_file)
+
+        return time.perf_counter() - start
+
     async def make_captions(self, image_file: str, logging: bool = False,
                             temperature: float = 0.2, max_new_tokens: int = 512):
-        input = "Please make a detailed caption of this picture."
-        return await self.predict(image_file, input, logging, temperature, max_new_tokens)
+        return await self.predict(image_file, self.CAPTION_PROMPT, logging, temperature, max_new_tokens)
 
     async def create_questions(self, image_file: str, logging: bool = False,
                                temperature: float = 0.2, max_new_tokens: int = 512):
-        input = f'Please create 5 questions which you can ask about this picture \
-                  separated by "\n" without enumeration.'
-        return await self.predict(image_file, input, logging, temperature, max_new_tokens)
+        return await self.predict(image_file, self.QUESTIONS_PROMPT, logging, temperature, max_new_tokens)
+
+    def extract_row(self,
+                    image_file: Union[str, bytes, SharedImage], columns: List[str], logging: bool = False,
+                    temperature: float = 0.0, max_new_tokens: Optional[int] = None, stop: Tuple[str, ...] = (),
+                    column_types: Dict[str, Union[str, List[str]]] = None) -> Dict:
+        result = self.generate_many([(image_file, extraction_prompt(columns, column_types))], logging, temperature,
+                                    max_new_tokens or extraction_max_new_tokens(columns), stop)[0]
+        return {**result, "fields": parse_extraction(result['outputs'], columns, column_types)}
@@ -0,0 +1,33 @@
+import os
+import sys
+import hashlib
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'evaluation'), os.path.join(ROOT, 'model')]
+
+from langchain.embeddings.base import Embeddings  # noqa: E402
+
+
+class FakeEmbeddings(Embeddings):
+    def __init__(self, dimension: int = 16):
+        self.dimension = dimension
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def _vector(self, text):
+        seed = int(hashlib.md5(text.encode('utf-8')).hexdigest()[:8], 16)
+        return np.random.default_rng(seed).normal(size=self.dimension).tolist()
+
+
+@pytest.fixture
+def fake_embeddings():
+    return FakeEmbeddings()
@@ -0,0 +1,91 @@
+import os
+
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from model import cpu_backend
+from model.cpu_backend import pin_cores, prepare_cpu_model, select_device
+
+
+class TinyLanguageModel(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.layers = torch.nn.ModuleList([torch.nn.Linear(8, 8), torch.nn.Linear(8, 8)])
+
+    def forward(self, x):
+        for layer in self.layers:
+            x = layer(x)
+        return x
+
+
+class TinyCausalLM(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.model = TinyLanguageModel()
+        self.lm_head = torch.nn.Linear(8, 16)
+
+    def get_model(self):
+        return self.model
+
+    def forward(self, x):
+        return self.lm_head(self.model(x))
+
+
+@pytest.fixture
+def affinity(monkeypatch):
+    pinned = []
+    monkeypatch.setattr(os, 'sched_getaffinity', lambda pid: set(range(8)), raising=False)
+    monkeypatch.setattr(os, 'sched_setaffinity', lambda pid, cores: pinned.append(list(cores)), raising=False)
+    return pinned
+
+
+def test_select_device(monkeypatch):
+    assert select_device('cpu') == 'cpu'
+    assert select_device('cuda') == 'cuda'
+
+    monkeypatch.setattr(cpu_backend.torch.cuda, 'is_available', lambda: False)
+    assert select_device('auto') == 'cpu'
+    monkeypatch.setattr(cpu_backend.torch.cuda, 'is_available', lambda: True)
+    assert select_device('auto') == 'cuda'
+
+
+def test_pin_cores_gives_workers_disjoint_cores(affinity):
+    assert pin_cores(0, 3) == [0, 1, 2]
+    assert pin_cores(1, 3) == [3, 4, 5]
+    assert affinity == [[0, 1, 2], [3, 4, 5]]
+
+
+def test_pin_cores_wraps_around_available_cores(affinity):
+    assert pin_cores(2, 3) == [6, 7, 0]
+    assert pin_cores(0, 32) == list(range(8))
+
+
+def test_pin_cores_without_affinity_support(monkeypatch):
+    monkeypatch.delattr(os, 'sched_setaffinity', raising=False)
+    assert pin_cores(0, 3) is None
+
+
+def test_prepare_cpu_model_int8_quantizes_layers_and_head():
+    model = TinyCausalLM()
+    inputs = torch.randn(2, 8)
+    expected = model(inputs)
+
+    model = prepare_cpu_model(model, 'int8')
+
+    assert all(isinstance(layer, torch.ao.nn.quantized.dynamic.Linear) for layer in model.get_model().layers)
+    assert isinstance(model.lm_head, torch.ao.nn.quantized.dynamic.Linear)
+    assert torch.allclose(model(inputs), expected, atol=0.1)
+
+
+def test_prepare_cpu_model_bf16_and_fp32():
+    assert next(prepare_cpu_model(TinyCausalLM(), 'bf16').parameters()).dtype == torch.bfloat16
+
+    model = prepare_cpu_model(TinyCausalLM().to(dtype=torch.float16), None)
+    assert next(model.parameters()).dtype == torch.float32
+    assert isinstance(model.lm_head, torch.nn.Linear)
+
+
+def test_prepare_cpu_model_rejects_unknown_quantization():
+    with pytest.raises(ValueError):
+        prepare_cpu_model(TinyCausalLM(), 'int4')
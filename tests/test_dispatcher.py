@@ -0,0 +1,114 @@
+import time
+import asyncio
+
+from contextlib import AsyncExitStack, asynccontextmanager
+
+import aiohttp
+
+from aiohttp import web
+
+from benchmarks.stub_services import StubServices
+from model.dispatcher import Dispatcher
+
+
+@asynccontextmanager
+async def stub_server(services: StubServices):
+    runner = web.AppRunner(services.create_app())
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+
+    try:
+        yield f'http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}'
+    finally:
+        await runner.cleanup()
+
+
+def stub(failure_rate: float = 0.0) -> StubServices:
+    return StubServices(latency_ms=0, jitter_ms=0, failure_rate=failure_rate)
+
+
+def create_dispatcher(urls, **kwargs) -> Dispatcher:
+    options = {"max_retries": 3, "backoff_seconds": 0.001, "failure_threshold": 2, "ejection_seconds": 30}
+    return Dispatcher(urls, **{**options, **kwargs})
+
+
+def run(services, scenario):
+    async def main():
+        async with AsyncExitStack() as stack:
+            urls = [await stack.enter_async_context(stub_server(service)) for service in services]
+            session = await stack.enter_async_context(aiohttp.ClientSession())
+            return await scenario(urls, session)
+
+    return asyncio.run(main())
+
+
+async def ask(dispatcher: Dispatcher, session, question: str = 'What is it?'):
+    return await dispatcher.post(session, 'create_vqa', {"image_file": 'image.jpg', "question": question})
+
+
+def test_retries_until_the_cap_without_ejecting_the_only_endpoint():
+    failing = stub(failure_rate=1.0)
+
+    async def scenario(urls, session):
+        dispatcher = create_dispatcher(urls)
+        start = time.perf_counter()
+        results = [await ask(dispatcher, session) for _ in range(2)]
+        return dispatcher, results, time.perf_counter() - start
+
+    dispatcher, results, elapsed = run([failing], scenario)
+
+    assert results == [None, None]
+    assert failing.requests['create_vqa'] == 2 * 4
+    assert len(dispatcher.failures) == 2
+    assert not dispatcher.stats[0]['ejected']
+    assert elapsed < 5
+
+
+def test_ejects_failing_endpoint_while_another_is_healthy():
+    failing, healthy = stub(failure_rate=1.0), stub()
+
+    async def scenario(urls, session):
+        dispatcher = create_dispatcher(urls)
+        return dispatcher, [await ask(dispatcher, session) for _ in range(5)]
+
+    dispatcher, results = run([failing, healthy], scenario)
+
+    assert all(result is not None for result in results)
+    assert failing.requests['create_vqa'] == 2
+    assert healthy.requests['create_vqa'] == 5
+    assert [target['ejected'] for target in dispatcher.stats] == [True, False]
+
+
+def test_readmits_endpoint_after_a_healthy_probe():
+    recovering, healthy = stub(failure_rate=1.0), stub()
+
+    async def scenario(urls, session):
+        dispatcher = create_dispatcher(urls, ejection_seconds=0.2)
+        await ask(dispatcher, session)
+        await ask(dispatcher, session)
+        ejected = dispatcher.stats[0]['ejected']
+
+        recovering.failure_rate = 0.0
+        await asyncio.sleep(0.3)
+        await ask(dispatcher, session)
+        return dispatcher, ejected
+
+    dispatcher, ejected = run([recovering, healthy], scenario)
+
+    assert ejected
+    assert not dispatcher.stats[0]['ejected']
+    assert recovering.requests['create_vqa'] == 3
+
+
+def test_does_not_retry_client_errors():
+    healthy = stub()
+
+    async def scenario(urls, session):
+        dispatcher = create_dispatcher(urls)
+        return await dispatcher.post(session, 'missing_endpoint', {"image_file": 'image.jpg'}), dispatcher
+
+    result, dispatcher = run([healthy], scenario)
+
+    assert result is None
+    assert dispatcher.stats[0]['consecutive_failures'] == 0
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from conftest import FakeEmbeddings
+from model.embedding_cache import CachedEmbeddings
+
+TEXTS = [f'Question number {i}?' for i in range(10)]
+
+
+def test_embeds_each_text_once(tmp_path, fake_embeddings):
+    cache = CachedEmbeddings(fake_embeddings, str(tmp_path))
+
+    first = cache.embed_documents(TEXTS[:6])
+    second = cache.embed_documents(TEXTS)
+
+    assert fake_embeddings.calls == [TEXTS[:6], TEXTS[6:]]
+    assert second[:6] == first
+    assert np.allclose(second, fake_embeddings.embed_documents(TEXTS))
+    assert cache.stats == {"hits": 6, "misses": 10, "entries": 10}
+
+
+def test_dedupes_within_a_call_and_batches_misses(tmp_path, fake_embeddings):
+    cache = CachedEmbeddings(fake_embeddings, str(tmp_path), batch_size=4)
+
+    vectors = cache.embed_documents(TEXTS + TEXTS[:3])
+
+    assert [len(call) for call in fake_embeddings.calls] == [4, 4, 2]
+    assert vectors[10:] == vectors[:3]
+    assert cache.stats["entries"] == 10
+
+
+def test_persists_across_instances(tmp_path, fake_embeddings):
+    expected = CachedEmbeddings(fake_embeddings, str(tmp_path)).embed_documents(TEXTS)
+
+    embeddings = FakeEmbeddings()
+    reopened = CachedEmbeddings(embeddings, str(tmp_path))
+
+    assert reopened.embed_documents(TEXTS) == expected
+    assert reopened.embed_query(TEXTS[0]) == expected[0]
+    assert embeddings.calls == []
+    assert reopened.stats == {"hits": 11, "misses": 0, "entries": 10}
+
+
+def test_grows_past_initial_capacity(tmp_path, fake_embeddings):
+    cache = CachedEmbeddings(fake_embeddings, str(tmp_path), initial_capacity=4)
+
+    for text in TEXTS:
+        cache.embed_query(text)
+
+    assert cache._vectors.shape[0] == 16
+    assert np.allclose(cache.embed_documents(TEXTS), fake_embeddings.embed_documents(TEXTS))
+    assert not (tmp_path / 'vectors.npy.tmp').exists()
+
+
+def test_rejects_embeddings_of_another_dimension(tmp_path, fake_embeddings):
+    CachedEmbeddings(fake_embeddings, str(tmp_path)).embed_documents(TEXTS[:2])
+
+    cache = CachedEmbeddings(FakeEmbeddings(dimension=8), str(tmp_path))
+    with pytest.raises(ValueError):
+        cache.embed_documents(['A new question?'])
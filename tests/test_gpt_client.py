@@ -0,0 +1,100 @@
+import time
+import asyncio
+
+from contextlib import asynccontextmanager
+
+from aiohttp import web
+
+from benchmarks.stub_services import StubServices
+from evaluation.gpt_client import GPTEvaluationClient, ScoreCache, TokenBucket
+
+PAIRS = [('What is the color?', 'red'), ('How many cats?', '2'), ('Where is it?', 'kitchen')]
+
+
+@asynccontextmanager
+async def stub_server(services: StubServices):
+    runner = web.AppRunner(services.create_app())
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+
+    try:
+        yield f'http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}'
+    finally:
+        await runner.cleanup()
+
+
+def create_client(base_url: str, **kwargs) -> GPTEvaluationClient:
+    options = {"api_key": 'test', "base_url": base_url, "requests_per_minute": 6000, "tokens_per_minute": 10 ** 7,
+               "max_retries": 3, "backoff_seconds": 0.01, "pairs_per_prompt": 2, "cache_path": None}
+    return GPTEvaluationClient(**{**options, **kwargs})
+
+
+def score(services: StubServices, pairs=PAIRS, **kwargs):
+    async def run():
+        async with stub_server(services) as base_url:
+            return await create_client(base_url, **kwargs).score_pairs(pairs, 'Rate the answer.')
+
+    return asyncio.run(run())
+
+
+def test_parse_scores_reads_packed_responses():
+    response = '1: 7\n[Pair 2]: 8.5\n3) 3\n9: 10\nnot a score'
+    assert GPTEvaluationClient.parse_scores(response, 4) == [7.0, 8.5, 3.0, None]
+
+
+def test_parse_scores_falls_back_to_first_number_for_single_pair():
+    assert GPTEvaluationClient.parse_scores('The answer deserves 9 out of 10.', 1) == [9.0]
+    assert GPTEvaluationClient.parse_scores('No idea.', 1) == [None]
+
+
+def test_packs_pairs_into_prompts():
+    services = StubServices(score=6)
+    assert score(services) == [6.0, 6.0, 6.0]
+    assert services.requests['chat_completions'] == 2
+
+
+def test_retries_rate_limited_requests():
+    services = StubServices(rate_limited=2)
+    start = time.perf_counter()
+    assert score(services, pairs=PAIRS[:1], backoff_seconds=0.05) == [7.0]
+
+    assert services.requests['chat_completions'] == 3
+    assert time.perf_counter() - start >= 0.05 * 0.5 + 0.1 * 0.5
+
+
+def test_gives_up_after_retry_cap():
+    services = StubServices(rate_limited=100)
+    assert score(services, pairs=PAIRS[:1], max_retries=2) == [None]
+    assert services.requests['chat_completions'] == 3
+
+
+def test_token_bucket_paces_after_burst():
+    async def run():
+        bucket = TokenBucket(600)
+        start = time.perf_counter()
+        await bucket.acquire(600)
+        burst = time.perf_counter() - start
+        await bucket.acquire(5)
+        return burst, time.perf_counter() - start
+
+    burst, elapsed = asyncio.run(run())
+    assert burst < 0.1
+    assert 0.4 <= elapsed < 1.5
+
+
+def test_score_cache_skips_scored_pairs(tmp_path):
+    cache_path = str(tmp_path / 'scores.sqlite')
+    services = StubServices(score=4)
+
+    assert score(services, cache_path=cache_path) == [4.0, 4.0, 4.0]
+    assert score(services, cache_path=cache_path) == [4.0, 4.0, 4.0]
+    assert services.requests['chat_completions'] == 2
+
+    cache = ScoreCache(cache_path)
+    cache.put('key', 5.0)
+    assert cache.get('key') == 5.0
+    assert cache.get('missing') is None
+
+    cache.put_many([('first', 1.0), ('second', 2.0)])
+    assert cache.get_many(['second', 'missing', 'first']) == [2.0, None, 1.0]
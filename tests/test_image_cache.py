@@ -0,0 +1,80 @@
+import threading
+
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from model.image_cache import ImageCache
+
+
+def tensor(kilobytes: int) -> torch.Tensor:
+    return torch.zeros(kilobytes * 256, dtype=torch.float32)
+
+
+def test_evicts_least_recently_used_entries_over_budget():
+    evicted = []
+    cache = ImageCache(max_bytes=3 * 1024, on_evict=evicted.append)
+
+    for key in 'abc':
+        cache.put(key, tensor(1))
+    cache.get('a')
+    cache.put('d', tensor(1))
+
+    assert evicted == ['b']
+    assert cache.get('b') is None and cache.get('a') is not None
+    assert cache.stats['bytes'] == 3 * 1024 and cache.stats['evictions'] == 1
+
+
+def test_sizes_nested_values_and_replaces_existing_keys():
+    cache = ImageCache(max_bytes=10 * 1024)
+
+    cache.put('a', (tensor(2), [tensor(1), 'not a tensor']))
+    assert cache.current_bytes == 3 * 1024
+
+    cache.put('a', tensor(1))
+    assert cache.current_bytes == 1024
+    assert cache.stats['entries'] == 1
+
+
+def test_skips_values_larger_than_the_budget():
+    cache = ImageCache(max_bytes=1024)
+    cache.put('small', tensor(1))
+    cache.put('large', tensor(2))
+
+    assert cache.get('large') is None
+    assert cache.get('small') is not None
+
+
+def test_concurrent_loads_of_one_image_run_the_loader_once(tmp_path):
+    image = tmp_path / 'image.bin'
+    image.write_bytes(b'image')
+    cache = ImageCache(max_bytes=1024 * 1024)
+    calls, started = [], threading.Event()
+
+    def loader(source):
+        calls.append(source)
+        started.wait(timeout=1)
+        return tensor(1)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load(str(image), loader)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    started.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert len({key for key, _ in results}) == 1
+    assert cache.stats['misses'] == 1 and cache.stats['hits'] == 3
+
+
+def test_keys_follow_content_for_bytes_and_file_changes(tmp_path):
+    image = tmp_path / 'image.bin'
+    image.write_bytes(b'first')
+    first = ImageCache.make_key(str(image))
+    image.write_bytes(b'second version')
+
+    assert ImageCache.make_key(str(image)) != first
+    assert ImageCache.make_key(b'same') == ImageCache.make_key(bytearray(b'same'))
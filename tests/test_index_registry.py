@@ -0,0 +1,126 @@
+import os
+import asyncio
+
+from types import SimpleNamespace
+
+import pytest
+
+from model.index_registry import IndexRegistry
+from model.question_index import QuestionIndex
+
+INDEX_BYTES = 100
+
+
+class FakeFinder:
+    def __init__(self, gates=None):
+        self.gates = gates if gates is not None else {}
+        self.question_index = None
+        self.dataset_id = None
+
+    async def create_column_names(self, image_files, dataset_id=None):
+        self.dataset_id = dataset_id
+        gate = self.gates.get(image_files[0])
+        if gate is not None:
+            await gate.wait()
+
+        self.question_index = SimpleNamespace(memory_bytes=INDEX_BYTES)
+        return [f'column for {image_files[0]}']
+
+    def load_index(self, dataset_id):
+        return False
+
+
+@pytest.fixture(autouse=True)
+def index_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+
+def create_registry(max_bytes=2.5 * INDEX_BYTES, gates=None):
+    finders = []
+
+    def factory():
+        finders.append(FakeFinder(gates))
+        return finders[-1]
+
+    registry = IndexRegistry(factory, max_bytes=max_bytes)
+    registry.finders = finders
+    return registry
+
+
+def test_evicts_least_recently_used_over_budget():
+    registry = create_registry()
+
+    async def run():
+        for dataset_id in ('a', 'b'):
+            await registry.build(dataset_id, [f'{dataset_id}.jpg'])
+        await registry.get('a')
+        await registry.build('c', ['c.jpg'])
+
+    asyncio.run(run())
+
+    assert list(registry.stats['resident']) == ['a', 'c']
+    assert registry.current_bytes == 2 * INDEX_BYTES
+    assert registry.evictions == 1
+
+
+def test_keeps_latest_and_the_last_entry_even_when_over_budget():
+    registry = create_registry(max_bytes=INDEX_BYTES // 2)
+
+    async def run():
+        await registry.build('a', ['a.jpg'])
+        assert list(registry.stats['resident']) == ['a']
+
+        await registry.build('b', ['b.jpg'])
+
+    asyncio.run(run())
+
+    assert list(registry.stats['resident']) == ['b']
+    assert registry.latest == 'b'
+
+
+def test_does_not_evict_a_dataset_while_it_is_rebuilt():
+    gate = asyncio.Event()
+    registry = create_registry(max_bytes=INDEX_BYTES, gates={'a-rebuild.jpg': gate})
+
+    async def run():
+        await registry.build('a', ['a.jpg'])
+        rebuild = asyncio.create_task(registry.build('a', ['a-rebuild.jpg'], rebuild=True))
+        await asyncio.sleep(0)
+
+        await registry.build('b', ['b.jpg'])
+        building = registry.stats['building']
+        resident = list(registry.stats['resident'])
+
+        gate.set()
+        await rebuild
+        return building, resident
+
+    building, resident = asyncio.run(run())
+
+    assert building == ['a']
+    assert resident == ['a', 'b']
+    assert list(registry.stats['resident']) == ['a']
+    assert registry.latest == 'a'
+
+
+def test_drop_removes_memory_and_persisted_index():
+    registry = create_registry()
+    path = QuestionIndex(None, dataset_id='a').path
+    os.makedirs(path)
+
+    async def run():
+        await registry.build('a', ['a.jpg'])
+        return await registry.drop('a'), await registry.drop('a')
+
+    assert asyncio.run(run()) == (True, False)
+    assert not os.path.exists(path)
+    assert registry.stats['resident'] == {} and registry.latest is None
+
+
+def test_build_without_persist_keeps_index_in_memory_only():
+    registry = create_registry()
+
+    asyncio.run(registry.build('a', ['a.jpg'], persist=False))
+
+    assert registry.finders[0].dataset_id is None
+    assert list(registry.stats['resident']) == ['a']
@@ -0,0 +1,130 @@
+import json
+import asyncio
+
+import pytest
+
+from main_pipeline import Controller
+from model.job_journal import JobJournal
+from configs.configs import VQA_QUESTION_SUFFIX
+
+COLUMNS = ['What is the animal?', 'How many people?']
+
+
+class ListSink:
+    def __init__(self):
+        self.rows = []
+        self.closed = False
+
+    def write(self, row):
+        self.rows.append(row)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def journal_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+
+def create_controller(failing=()):
+    controller = Controller(llava_urls=['http://127.0.0.1:1'], faiss_url='http://127.0.0.1:1')
+    controller.evaluation_on = False
+    controller.requests = []
+
+    def fill_columns(image_files, user_columns=None):
+        controller.columns = list(COLUMNS)
+
+    async def post(session, endpoint, payload):
+        controller.requests.append(payload['image_file'])
+        if payload['image_file'] in failing:
+            return None
+        return {"answers": {question: {"outputs": f"{payload['image_file']}:{question}</s>"}
+                            for question in json.loads(payload['questions'])}}
+
+    controller._fill_columns = fill_columns
+    controller.dispatcher.post = post
+    return controller
+
+
+def create_job(job_id: str, size: int, complete: int) -> JobJournal:
+    journal = JobJournal(job_id)
+    journal.create([f'image_{i}.jpg' for i in range(size)], COLUMNS)
+    for i in range(complete):
+        journal.record(i, f'image_{i}.jpg', {column: f'journaled {i}' for column in COLUMNS})
+    journal.close()
+    return journal
+
+
+def test_resume_skips_journaled_rows_beyond_the_window():
+    create_job('job1', 300, 200)
+    controller = create_controller()
+
+    dataframe = asyncio.run(controller.run_job('job1'))
+
+    assert len(dataframe) == 300
+    assert sorted(controller.requests) == sorted(f'image_{i}.jpg' for i in range(200, 300))
+    assert dataframe.iloc[150][COLUMNS[0]] == 'journaled 150'
+    assert dataframe.iloc[250][COLUMNS[0]] == f'image_250.jpg:{COLUMNS[0]}{VQA_QUESTION_SUFFIX}'
+    assert controller.job_progress('job1')['status'] == 'completed'
+
+
+def test_resume_asks_only_missing_cells():
+    journal = create_job('job2', 3, 0)
+    journal.record(1, 'image_1.jpg', {COLUMNS[0]: 'cat'})
+    journal.close()
+
+    questions = []
+    controller = create_controller()
+    post = controller.dispatcher.post
+
+    async def recording_post(session, endpoint, payload):
+        questions.append((payload['image_file'], json.loads(payload['questions'])))
+        return await post(session, endpoint, payload)
+
+    controller.dispatcher.post = recording_post
+    dataframe = asyncio.run(controller.run_job('job2'))
+
+    assert dict(questions)['image_1.jpg'] == [COLUMNS[1] + VQA_QUESTION_SUFFIX]
+    assert dataframe.iloc[1][COLUMNS[0]] == 'cat'
+
+
+def test_failed_rows_are_retried_on_resume():
+    controller = create_controller(failing={'image_1.jpg'})
+    image_files = [f'image_{i}.jpg' for i in range(4)]
+
+    asyncio.run(controller.run_job('job3', image_files))
+    progress = controller.job_progress('job3')
+    assert progress['status'] == 'incomplete'
+    assert progress['failed_cells'] == len(COLUMNS)
+
+    controller = create_controller()
+    dataframe = asyncio.run(controller.run_job('job3'))
+
+    assert controller.requests == ['image_1.jpg']
+    assert dataframe[COLUMNS[1]].notna().all()
+    assert controller.job_progress('job3')['status'] == 'completed'
+
+
+def test_sink_receives_rows_and_run_returns_progress():
+    create_job('job4', 10, 5)
+    controller = create_controller()
+    sink = ListSink()
+
+    progress = asyncio.run(controller.run_job('job4', sink=sink))
+
+    assert sorted(row['index'] for row in sink.rows) == list(range(10))
+    assert sink.closed
+    assert progress['status'] == 'completed' and progress['completed_cells'] == 10 * len(COLUMNS)
+
+
+def test_journal_reloads_answers_and_ignores_torn_lines():
+    journal = create_job('job5', 2, 1)
+    with open(journal.answers_path, 'a') as file:
+        file.write('{"index": 1, "col')
+
+    reloaded = JobJournal('job5')
+    assert reloaded.load()
+    assert reloaded.missing(0) == []
+    assert reloaded.missing(1) == COLUMNS
+    assert reloaded.row(0)[COLUMNS[1]] == 'journaled 0'
@@ -0,0 +1,69 @@
+import pytest
+
+from conftest import FakeEmbeddings
+from model.question_index import QuestionIndex
+
+QUESTIONS = [f'Question number {i}?' for i in range(30)]
+
+
+class CaseInsensitiveEmbeddings(FakeEmbeddings):
+    def _vector(self, text):
+        return super()._vector(text.lower().rstrip('?'))
+
+
+@pytest.mark.parametrize('index_type', QuestionIndex.INDEX_TYPES)
+def test_adds_unique_questions_and_finds_them(fake_embeddings, index_type):
+    index = QuestionIndex(fake_embeddings, index_type=index_type, nlist=4)
+
+    assert index.add(QUESTIONS + QUESTIONS[:5]) == len(QUESTIONS)
+    assert index.add(QUESTIONS[:10] + ['One more?']) == 1
+
+    assert index.questions == QUESTIONS + ['One more?']
+    assert index.nearest(['Question number 7?', 'One more?']) == ['Question number 7?', 'One more?']
+    assert index.memory_bytes >= len(index.questions) * fake_embeddings.dimension * 4
+
+
+@pytest.mark.parametrize('index_type', QuestionIndex.INDEX_TYPES)
+def test_saves_and_loads_per_dataset(tmp_path, fake_embeddings, index_type):
+    index = QuestionIndex(fake_embeddings, dataset_id='dataset', index_type=index_type, index_dir=str(tmp_path))
+    index.add(QUESTIONS)
+    index.metadata = {"columns": QUESTIONS[:3]}
+    index.save()
+
+    loaded = QuestionIndex(fake_embeddings, dataset_id='dataset', index_type=index_type, index_dir=str(tmp_path))
+    assert loaded.load()
+    assert loaded.questions == QUESTIONS
+    assert loaded.metadata == {"columns": QUESTIONS[:3]}
+    assert loaded.nearest(['Question number 12?']) == ['Question number 12?']
+
+    assert not QuestionIndex(fake_embeddings, dataset_id='other', index_dir=str(tmp_path)).load()
+
+
+def test_index_without_dataset_is_not_persisted(tmp_path, fake_embeddings):
+    index = QuestionIndex(fake_embeddings, index_dir=str(tmp_path))
+    index.add(QUESTIONS)
+    index.save()
+
+    assert index.path is None and not index.exists()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_empty_index_answers_none(fake_embeddings):
+    index = QuestionIndex(fake_embeddings)
+    assert index.nearest(['Anything?']) == [None]
+    assert index.memory_bytes == 0
+    assert index.cluster(0.9) == {}
+
+
+def test_cluster_merges_near_duplicates():
+    index = QuestionIndex(CaseInsensitiveEmbeddings())
+    index.add(['How many cats?', 'how many cats', 'What color is the car?', 'What color is the car'])
+
+    assert index.cluster(0.99) == {'How many cats?': 'How many cats?', 'how many cats': 'How many cats?',
+                                   'What color is the car?': 'What color is the car?',
+                                   'What color is the car': 'What color is the car?'}
+
+
+def test_rejects_unknown_index_type(fake_embeddings):
+    with pytest.raises(ValueError):
+        QuestionIndex(fake_embeddings, index_type='lsh')
@@ -0,0 +1,126 @@
+import os
+import json
+import asyncio
+
+import pytest
+
+ray = pytest.importorskip('ray')
+
+from model.ray_pool import RayActorPool, RayDispatcher, SharedRayPool
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class StubFormer:
+    QUESTIONS_PROMPT = 'questions'
+    CAPTION_PROMPT = 'caption'
+
+    def generate_many(self, requests, logging=False, temperature=0.2, max_new_tokens=16, stop=(), answer_types=None):
+        worker = os.environ.get('TABLE_FORMER_WORKER_INDEX')
+        return [{"prompt": input, "outputs": f'{len(image_file)}@{worker}'} for image_file, input in requests]
+
+
+def stub_factory():
+    return StubFormer()
+
+
+@pytest.fixture(scope='module', autouse=True)
+def local_ray():
+    ray.init(num_cpus=2, include_dashboard=False, namespace='test_ray_pool',
+             runtime_env={'env_vars': {'PYTHONPATH': os.pathsep.join([ROOT, os.path.dirname(__file__)])}})
+    yield
+    ray.shutdown()
+
+
+@pytest.fixture
+def image_file(tmp_path):
+    path = tmp_path / 'image.bin'
+    path.write_bytes(b'x' * 1234)
+    return str(path)
+
+
+def create_pool(**kwargs) -> RayActorPool:
+    options = {"factory": stub_factory, "min_replicas": 1, "max_replicas": 2, "target_ongoing_requests": 1,
+               "downscale_seconds": 3600, "actor_options": {}}
+    pool = RayActorPool(**{**options, **kwargs})
+    pool.wait_ready(timeout=60)
+    return pool
+
+
+async def ask(dispatcher: RayDispatcher, image_file: str, questions):
+    return await asyncio.gather(*[dispatcher.post(None, 'create_vqa_batch',
+                                                  {"image_file": image_file, "questions": json.dumps([question])})
+                                  for question in questions])
+
+
+def test_routes_requests_across_scaled_up_replicas(image_file):
+    pool = create_pool()
+    try:
+        results = asyncio.run(ask(RayDispatcher(pool), image_file, [f'question {i}' for i in range(6)]))
+
+        outputs = [result['answers'][f'question {i}']['outputs'] for i, result in enumerate(results)]
+        assert {output.split('@')[0] for output in outputs} == {'1234'}
+        assert {output.split('@')[1] for output in outputs} == {'0', '1'}
+        assert len(pool.replicas) == 2
+        assert all(replica['outstanding'] == 0 for replica in pool.stats)
+    finally:
+        pool.shutdown()
+
+
+def test_replaces_dead_replica_under_a_fresh_name(image_file):
+    pool = create_pool(max_replicas=1)
+    dispatcher = RayDispatcher(pool, max_retries=2)
+    try:
+        dead = pool.replicas[0]
+        ray.kill(dead.handle, no_restart=True)
+
+        result = asyncio.run(ask(dispatcher, image_file, ['after death']))[0]
+
+        assert result['answers']['after death']['outputs'] == '1234@0'
+        assert pool.replaced == 1
+        assert [replica.name for replica in pool.replicas] != [dead.name]
+        assert dispatcher.failures == []
+    finally:
+        pool.shutdown()
+
+
+def test_scales_down_idle_replicas(image_file):
+    pool = create_pool(downscale_seconds=0)
+    try:
+        asyncio.run(ask(RayDispatcher(pool), image_file, [f'question {i}' for i in range(4)]))
+
+        assert len(pool.replicas) == 1
+        assert pool.created == 2
+    finally:
+        pool.shutdown()
+
+
+def test_pools_do_not_share_replicas():
+    first, second = create_pool(), create_pool()
+    try:
+        assert first.name != second.name
+        assert not {replica.name for replica in first.replicas} & {replica.name for replica in second.replicas}
+    finally:
+        first.shutdown()
+        second.shutdown()
+
+
+def test_dispatchers_share_one_pool_until_the_last_closes(image_file):
+    options = {"factory": stub_factory, "name": 'shared', "min_replicas": 1, "max_replicas": 2,
+               "target_ongoing_requests": 1, "downscale_seconds": 3600, "actor_options": {}}
+    first, second = RayDispatcher(SharedRayPool(**options)), RayDispatcher(SharedRayPool(**options))
+    try:
+        assert [replica['name'] for replica in first.stats] == [replica['name'] for replica in second.stats]
+        assert len(first.stats) == 1
+
+        ray.kill(ray.get_actor(first.stats[0]['name']), no_restart=True)
+        result = asyncio.run(ask(second, image_file, ['through the manager']))[0]
+        assert result['answers']['through the manager']['outputs'] == '1234@0'
+        assert second.failures == []
+
+        first.close()
+        assert len(second.stats) == 1
+        second.close()
+        assert second.stats == []
+    finally:
+        ray.kill(first.pool.manager)
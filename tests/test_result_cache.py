@@ -0,0 +1,48 @@
+import threading
+
+from model.result_cache import ResultCache
+
+
+def create_cache(tmp_path, memory_entries: int = 10) -> ResultCache:
+    return ResultCache(str(tmp_path / 'results.sqlite'), 'model', memory_entries=memory_entries)
+
+
+def test_keys_ignore_question_formatting_but_not_options(tmp_path):
+    cache = create_cache(tmp_path)
+    try:
+        key = cache.make_key(b'image', 'What  is it? ', 0.0, 16)
+
+        assert key == cache.make_key(b'image', 'what is it?', 0.0, 16)
+        assert key != cache.make_key(b'other image', 'what is it?', 0.0, 16)
+        assert key != cache.make_key(b'image', 'what is it?', 0.0, 16, {"answer_type": 'numeric'})
+    finally:
+        cache.close()
+
+
+def test_put_does_not_wait_for_sqlite(tmp_path):
+    cache = create_cache(tmp_path)
+    try:
+        with cache._db_lock:
+            finished = threading.Event()
+            threading.Thread(target=lambda: (cache.put('key', {"outputs": 'cat'}), finished.set())).start()
+            assert finished.wait(timeout=1)
+
+        assert cache.get('key') == {"outputs": 'cat'}
+    finally:
+        cache.close()
+
+
+def test_results_survive_restart_and_memory_eviction(tmp_path):
+    cache = create_cache(tmp_path, memory_entries=2)
+    for i in range(5):
+        cache.put(f'key {i}', {"outputs": str(i)})
+    assert cache.stats['memory_entries'] == 2
+    cache.close()
+
+    cache = create_cache(tmp_path, memory_entries=2)
+    try:
+        assert cache.get('key 0') == {"outputs": '0'}
+        assert cache.get('missing') is None
+        assert cache.stats == {"hits": 1, "misses": 1, "memory_entries": 1}
+    finally:
+        cache.close()
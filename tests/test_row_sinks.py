@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+
+from model.row_sinks import CsvRowSink, ParquetRowSink, RowSink
+
+COLUMNS = ['index', 'image', 'What is the animal?']
+
+
+def rows(start: int, stop: int):
+    return [{"index": i, "image": f'image_{i}.jpg', "What is the animal?": 'cat' if i % 2 else None}
+            for i in range(start, stop)]
+
+
+def test_row_sink_is_abstract(tmp_path):
+    with pytest.raises(TypeError):
+        RowSink(str(tmp_path / 'rows'))
+
+
+def test_csv_sink_flushes_row_groups_and_appends_without_a_second_header(tmp_path):
+    path = tmp_path / 'rows.csv'
+
+    sink = CsvRowSink(str(path), row_group_size=2)
+    for row in rows(0, 3):
+        sink.write(row)
+    assert len(pd.read_csv(path)) == 2
+    sink.close()
+
+    with CsvRowSink(str(path)) as sink:
+        for row in rows(3, 5):
+            sink.write({**row, "extra": 'ignored'})
+
+    dataframe = pd.read_csv(path)
+    assert list(dataframe.columns) == COLUMNS
+    assert dataframe['index'].tolist() == list(range(5))
+    assert dataframe['What is the animal?'].isna().tolist() == [True, False, True, False, True]
+
+
+def test_parquet_sink_writes_one_row_group_per_flush(tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    path = tmp_path / 'rows.parquet'
+
+    with ParquetRowSink(str(path), row_group_size=2) as sink:
+        for row in rows(0, 5):
+            sink.write(row)
+
+    assert pq.ParquetFile(path).num_row_groups == 3
+    dataframe = pd.read_parquet(path)
+    assert list(dataframe.columns) == COLUMNS
+    assert dataframe['index'].tolist() == list(range(5))
+    assert dataframe['What is the animal?'].isna().tolist() == [True, False, True, False, True]
@@ -0,0 +1,69 @@
+from model.structured_extraction import extraction_max_new_tokens, extraction_prompt, parse_extraction
+
+COLUMNS = ['What is the animal?', 'How many people?', 'Is it outdoors?']
+COLUMN_TYPES = {'How many people?': 'numeric', 'Is it outdoors?': ['yes', 'no']}
+
+
+def test_prompt_lists_every_column_with_its_type():
+    prompt = extraction_prompt(COLUMNS, COLUMN_TYPES)
+
+    assert '"What is the animal?": a short answer' in prompt
+    assert '"How many people?": a number' in prompt
+    assert '"Is it outdoors?": one of yes, no' in prompt
+
+
+def test_parses_json_surrounded_by_text():
+    output = ('Here is the row: {"What is the animal?": "a cat", "How many people?": 3, '
+              '"Is it outdoors?": "Yes"}</s>')
+
+    assert parse_extraction(output, COLUMNS, COLUMN_TYPES) == {
+        'What is the animal?': 'a cat', 'How many people?': '3', 'Is it outdoors?': 'yes'}
+
+
+def test_maps_json_booleans_to_yes_no():
+    output = '{"What is the animal?": "dog", "How many people?": 0, "Is it outdoors?": false}'
+    assert parse_extraction(output, COLUMNS, COLUMN_TYPES)['Is it outdoors?'] == 'no'
+
+    output = '{"Is it outdoors?": true}'
+    assert parse_extraction(output, ['Is it outdoors?'])['Is it outdoors?'] == 'yes'
+
+
+def test_parses_keyed_lines_when_json_is_missing():
+    output = '1. What is the animal?: dog\n- How many people?: 2\n"Is it outdoors?" = no'
+
+    assert parse_extraction(output, COLUMNS, COLUMN_TYPES) == {
+        'What is the animal?': 'dog', 'How many people?': '2', 'Is it outdoors?': 'no'}
+
+
+def test_matches_keys_loosely():
+    output = '{"what is the animal": "horse", "HOW MANY PEOPLE": "4"}'
+
+    assert parse_extraction(output, COLUMNS, COLUMN_TYPES) == {
+        'What is the animal?': 'horse', 'How many people?': '4', 'Is it outdoors?': None}
+
+
+def test_rejects_values_that_break_the_column_type():
+    output = '{"What is the animal?": "", "How many people?": "many", "Is it outdoors?": "maybe"}'
+
+    assert parse_extraction(output, COLUMNS, COLUMN_TYPES) == {
+        'What is the animal?': None, 'How many people?': None, 'Is it outdoors?': None}
+
+
+def test_rejects_nested_values_and_garbage():
+    assert parse_extraction('{"What is the animal?": ["cat", "dog"]}', COLUMNS)['What is the animal?'] is None
+    assert parse_extraction('I cannot see the picture.', COLUMNS) == {column: None for column in COLUMNS}
+
+
+def test_recovers_complete_fields_from_truncated_json():
+    output = '{"What is the animal?": "cat",\n"How many people?": "tw'
+
+    assert parse_extraction(output, COLUMNS, COLUMN_TYPES) == {
+        'What is the animal?': 'cat', 'How many people?': None, 'Is it outdoors?': None}
+
+
+def test_token_budget_grows_with_columns():
+    narrow = extraction_max_new_tokens(COLUMNS[:1])
+    wide = extraction_max_new_tokens([f'What is shown in column {i}?' for i in range(40)])
+
+    assert narrow < extraction_max_new_tokens(COLUMNS) < wide
+    assert wide > 40 * 16